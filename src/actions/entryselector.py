@@ -1,172 +1,218 @@
+import html
+
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QTextCursor
 
 from actions.generic import clearTabSearch
+from contentdecoder import decodeContent
+from harfields import parseSaml
 
 class EntrySelector():
+    """Show the selected entry in the request and response tabs.
+
+    Only the tab showing in each of the request and response panels is filled in
+    straight away, the others are filled in if and when they are switched to (see
+    populateTab). Fields are looked up as they are needed, so bodies are only read
+    from the HAR file and decoded when a body tab is filled in.
+    """
+
     def __init__(self, app):
         self.app = app
-        self.entry_data = None
+        self.entry_id = None
+        self.store = None
+        self.populated = set()
         self.main()
 
     def main(self):
+        # tab changes from here on are for this entry
+        self.app.entry_selector = self
         self._collectData()
-        self._prepareTabs()
-        self._populateRequestHeaders()
-        self._populateRequestParams()
-        self._populateRequestCookies()
-        self._populateRequestBody()
-        self._populateRequestSaml()
-        self._populateResponseHeaders()
-        self._populateResponseCookies()
-        self._populateResponseBody()
+        clearTabSearch(self.app, tab_group='all')
+        self._enableTabs()
+        self.populateTab('request', self.app.request_tabs.currentIndex())
+        self.populateTab('response', self.app.response_tabs.currentIndex())
+
+    def populateTab(self, tab_group, index):
+        """Fill in a tab, unless it has already been filled in for this entry."""
+        if (tab_group, index) in self.populated or index < 0:
+            return
+        self.populated.add((tab_group, index))
+
+        if tab_group == 'request':
+            textedit = self.app.request_textedits[index]
+            populate = (self._populateRequestHeaders, self._populateRequestParams,
+                        self._populateRequestCookies, self._populateRequestBody,
+                        self._populateRequestSaml)[index]
+        else:
+            textedit = self.app.response_textedits[index]
+            populate = (self._populateResponseHeaders, self._populateResponseCookies,
+                        self._populateResponseBody)[index]
 
-    def _collectData(self):
-        row_id = self.app.entries_table.item(self.app.entries_table.currentRow(), 0).text()
-        self.entry_data = self.app.har_parsed[row_id]
+        textedit.setPlainText('')
+        populate()
 
-    def _prepareTabs(self):
-        """Clear the textboxes and remove any highlighting."""
-        for textedit in self.app.request_textedits + self.app.response_textedits:
-            textedit.setPlainText('')
-        clearTabSearch(self.app, tab_group='all')
+    def _collectData(self):
+        row = self.app.entries_table.currentIndex().row()
+        self.entry_id = self.app.entries_model.entryId(row)
+        self.store = self.app.entries_model.store
+
+    def _value(self, field):
+        return self.store.value(self.entry_id, field)
+
+    def _enableTabs(self):
+        """Disable the tabs which the entry has no data for. The headers tabs are
+        always enabled. Disabling the current tab switches to another, which is filled
+        in through tabChanged. Bodies are checked for without reading them."""
+        store = self.store
+        entry_id = self.entry_id
+        request_tabs = (
+            (1, self._value('request_queryString')),
+            (2, self._value('request_cookies')),
+            (3, (not store.isEmpty(entry_id, 'request_postData_text')
+                 or self._value('request_postData_params'))),
+            (4, self._value('has_saml')),
+        )
+        response_tabs = (
+            (1, self._value('response_cookies')),
+            (2, not store.isEmpty(entry_id, 'response_content_text')),
+        )
+        for position, data in request_tabs:
+            self.app.request_tabs.setTabEnabled(position, bool(data))
+        for position, data in response_tabs:
+            self.app.response_tabs.setTabEnabled(position, bool(data))
+
+    def _renderTab(self, textedit, tab_name, render):
+        """Show the HTML lines made by render in a tab, set all at once. Rendered tabs
+        are cached by entry ID so going back to an entry doesn't render them again."""
+        key = (self.entry_id, tab_name)
+        document = self.app.render_cache.get(key)
+        if document is None:
+            document = '<br>'.join(render())
+            self.app.render_cache.put(key, document)
+        textedit.setHtml(document)
+        textedit.moveCursor(QTextCursor.Start)
 
     def _populateRequestHeaders(self):
-        request_headers = self.entry_data['request_headers']
-        request_method = self.entry_data['request_method'].upper()
-        request_url = self.entry_data['request_url']
-        request_version = self.entry_data['request_httpVersion'].upper()
-        request_summary = '{} {} {}\n'.format(request_method, request_url, request_version)
-        self.app.request_headers_tab_text.append(request_summary)
+        self._renderTab(self.app.request_headers_tab_text, 'request_headers', self._renderRequestHeaders)
+
+    def _renderRequestHeaders(self):
+        request_headers = self._value('request_headers')
+        request_method = self._value('request_method').upper()
+        request_url = self._value('request_url')
+        request_version = self._value('request_httpVersion').upper()
+        request_summary = '{} {} {}'.format(request_method, request_url, request_version)
+        lines = [html.escape(request_summary), '']
 
         sort_headers = self.app.config.getConfig('sort-headers')
         if sort_headers:
             request_headers = sorted(request_headers, key=lambda name: name['name'])
-            
-        for header in request_headers:
-            entry = '<b>{}</b>: {}'.format(header.get('name'), header.get('value'))
-            self.app.request_headers_tab_text.append(entry)
 
-        self.app.request_headers_tab_text.moveCursor(QTextCursor.Start)
+        lines.extend(self._renderPairs((header.get('name'), header.get('value'))
+                                       for header in request_headers))
+        return lines
 
     def _populateRequestParams(self):
-        for param in self.entry_data['request_queryString']:
+        self._renderTab(self.app.request_query_tab_text, 'request_params', self._renderRequestParams)
+
+    def _renderRequestParams(self):
+        lines = []
+        for param in self._value('request_queryString'):
             # query string parameters may have names only without any values
             if not param.get('value'):
-                entry = '{}'.format(param.get('name'))
+                lines.append(html.escape('{}'.format(param.get('name'))))
             else:
-                entry = '<b>{}</b>: {}'.format(param.get('name'), param.get('value'))
-            self.app.request_query_tab_text.append(entry)
-
-        self._toggleTabVisibility(self.app.request_tabs, self.app.request_query_tab_text, 1)
-        self.app.request_query_tab_text.moveCursor(QTextCursor.Start)
+                lines.extend(self._renderPairs([(param.get('name'), param.get('value'))]))
+        return lines
 
     def _populateRequestCookies(self):
-        for cookie in self.entry_data['request_cookies']:
+        self._renderTab(self.app.request_cookie_tab_text, 'request_cookies',
+                        lambda: self._renderCookies(self._value('request_cookies')))
+
+    @staticmethod
+    def _renderPairs(pairs):
+        return ['<b>{}</b>: {}'.format(html.escape(str(name)), html.escape(str(value)))
+                for name, value in pairs]
+
+    @classmethod
+    def _renderCookies(cls, cookies):
+        lines = []
+        for cookie in cookies:
             # self-constructed cookie objects (strings)
-            try:
-                self.app.request_cookie_tab_text.append(cookie)
+            if isinstance(cookie, str):
+                lines.append(html.escape(cookie))
             # cookie object from HAR (dicts)
-            except TypeError:
-                for param in cookie:
-                    entry = '<b>{}</b>: {}'.format(param, cookie[param])
-                    self.app.request_cookie_tab_text.append(entry)
-                self.app.request_cookie_tab_text.append('')
-
-        self._toggleTabVisibility(self.app.request_tabs, self.app.request_cookie_tab_text, 2)
-        self.app.request_cookie_tab_text.moveCursor(QTextCursor.Start)
+            else:
+                lines.extend(cls._renderPairs(cookie.items()))
+                lines.append('')
+        return lines
 
     def _populateRequestBody(self):
-        post_text = self.entry_data['request_postData_text']
-        post_params = self.entry_data['request_postData_params']
+        post_text = self._value('request_postData_text')
+        post_params = self._value('request_postData_params')
 
         if post_text:
-            # truncate large post bodies by default
-            truncate_length = self.app.config.getConfig('truncate-character-count')
-            if len(post_text) > truncate_length:
-                self.app.request_expand_button.show()
-                self.app.request_body_tab_text.appendPlainText(post_text[:truncate_length])
-                self.app.request_body_tab_text.appendPlainText('. . .')
-            else:
-                self.app.request_expand_button.hide()
-                self.app.request_body_tab_text.appendPlainText(post_text)
+            self.app.request_body_tab_text.setBody(post_text)
 
         elif post_params:
+            lines = []
             for param in post_params:
                 for k, v in param.items():
-                    entry = '{}: {}'.format(k, v)
-                    self.app.request_body_tab_text.appendPlainText(entry)
-                self.app.request_body_tab_text.appendPlainText('')
-            self.app.request_expand_button.hide()
+                    lines.append('{}: {}'.format(k, v))
+                lines.append('')
+            self.app.request_body_tab_text.setBody('\n'.join(lines))
+
+        self.app.pretty_printer.showBody('request', self.entry_id, post_text,
+                                         self._value('request_postData_mimeType'))
 
         self.app.request_body_tab_text.moveCursor(QTextCursor.Start)
-        self._toggleTabVisibility(self.app.request_tabs, self.app.request_body_tab_text, 3)
     
     def _populateRequestSaml(self):
-        saml_request = self.entry_data['saml_request']
-        saml_response = self.entry_data['saml_response']
-        
-        if saml_request:
-            self.app.request_saml_tab_text.appendPlainText(saml_request)
-        else:
-            self.app.request_saml_tab_text.appendPlainText(saml_response)
+        # the flag is set on import, messages are only decoded when the entry is viewed
+        if self._value('has_saml'):
+            saml_request = parseSaml(self._value('request_queryString'), 'request')
+            if saml_request:
+                self.app.request_saml_tab_text.appendPlainText(saml_request)
+            else:
+                saml_response = parseSaml(self._value('request_postData_text'), 'response')
+                self.app.request_saml_tab_text.appendPlainText(saml_response)
         
         self.app.request_saml_tab_text.moveCursor(QTextCursor.Start)
-        self._toggleTabVisibility(self.app.request_tabs, self.app.request_saml_tab_text, 4)
 
     def _populateResponseHeaders(self):
-        response_headers = self.entry_data['response_headers']
-        response_version = self.entry_data['response_httpVersion'].upper()  
-        response_status_code = self.entry_data['response_status']
-        response_status_text = self.entry_data['response_statusText']
-        response_summary = '{} {} {}\n'.format(response_version, response_status_code, response_status_text)
-        self.app.response_headers_tab_text.append(response_summary)
+        self._renderTab(self.app.response_headers_tab_text, 'response_headers', self._renderResponseHeaders)
+
+    def _renderResponseHeaders(self):
+        response_headers = self._value('response_headers')
+        response_version = self._value('response_httpVersion').upper()  
+        response_status_code = self._value('response_status')
+        response_status_text = self._value('response_statusText')
+        response_summary = '{} {} {}'.format(response_version, response_status_code, response_status_text)
+        lines = [html.escape(response_summary), '']
 
         # sort response headers by name
         sort_headers = self.app.config.getConfig('sort-headers')
         if sort_headers:
             response_headers = sorted(response_headers, key=lambda name: name['name'])
 
-        for header in response_headers:
-            entry = '<b>{}</b>: {}'.format(header.get('name'), header.get('value'))
-            self.app.response_headers_tab_text.append(entry)
-
-        self.app.response_headers_tab_text.moveCursor(QTextCursor.Start)
+        lines.extend(self._renderPairs((header.get('name'), header.get('value'))
+                                       for header in response_headers))
+        return lines
 
     def _populateResponseCookies(self):
-        for cookie in self.entry_data['response_cookies']:
-            # self-constructed cookie objects (strings)
-            try:
-                self.app.response_cookie_tab_text.append(cookie)
-            # cookie object from HAR (dicts)
-            except TypeError:
-                for param in cookie:
-                    entry = '<b>{}</b>: {}'.format(param, cookie[param])
-                    self.app.response_cookie_tab_text.append(entry)
-                self.app.response_cookie_tab_text.append('')
-
-        self._toggleTabVisibility(self.app.response_tabs, self.app.response_cookie_tab_text, 1)
-        self.app.response_cookie_tab_text.moveCursor(QTextCursor.Start)
+        self._renderTab(self.app.response_cookie_tab_text, 'response_cookies',
+                        lambda: self._renderCookies(self._value('response_cookies')))
 
     def _populateResponseBody(self):
-        response_content = self.entry_data['response_content_text']
-        # truncate large response content by default
-        truncate_length = self.app.config.getConfig('truncate-character-count')
-        if len(response_content) > truncate_length:
-            self.app.response_expand_button.show()
-            self.app.response_body_tab_text.appendPlainText(response_content[:truncate_length])
-            self.app.response_body_tab_text.appendPlainText('. . .')
-        else:
-            self.app.response_expand_button.hide()
-            self.app.response_body_tab_text.appendPlainText(response_content)
+        response_mime_type = self._value('response_content_mimeType')
+        response_content = decodeContent(self._value('response_content_text'),
+                                         self._value('response_content_encoding'),
+                                         response_mime_type,
+                                         (self.entry_id, 'response_content_text'))
+        # large bodies are shown a window at a time by the body viewer
+        self.app.response_body_tab_text.setBody(response_content.text)
+        # hex dumps of binary content are left alone
+        self.app.pretty_printer.showBody('response', self.entry_id,
+                                         '' if response_content.binary else response_content.text,
+                                         response_mime_type)
 
         self.app.response_body_tab_text.moveCursor(QTextCursor.Start)
-        self._toggleTabVisibility(self.app.response_tabs, self.app.response_body_tab_text, 2)
-
-    @staticmethod
-    def _toggleTabVisibility(tab, text_edit, position):
-        """If the tab contains no data, disable it, otherwise enable it."""
-        if not text_edit.toPlainText():
-            tab.setTabEnabled(position, False)
-        else:
-            tab.setTabEnabled(position, True)
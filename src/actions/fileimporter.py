@@ -1,38 +1,46 @@
 import json
-import random
-import re
-import string
+import os
 import time
 
-from base64 import b64decode
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
-from zlib import decompress
-
+from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QThread
+from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtWidgets import QFileDialog
-from PyQt5.QtWidgets import QTableWidgetItem
 
+from contentdecoder import clearCache
+from entriesmodel import visibleFields
+from entrystore import EntryStore
+from harcache import fingerprint
+from harcache import loadCache
+from harcache import saveCache
+from harreader import HarReader
 from harshark_exceptions import HarImportException
 from actions.generic import colourizeCells
 from actions.generic import resizeColumns
 from actions.generic import toggleColumnVisibility
 
 class FileImporter():
+    """Import a HAR file chosen by the user. The file is read and parsed by an
+    ImportWorker on a background thread; parsed entries are added to the entries table
+    in batches as they arrive so the UI stays responsive throughout.
+    """
+
     def __init__(self, app):
         self.app = app
         self.har_path = None
-        self.har_raw = None
+        self.har_size = 0
+        self.worker = None
         self.import_start = None
+        self.import_error = None
+        self.cancelled = False
+        self.previous = None
         self.har_summary = {}
-        self.har_parsed = {}
+        self.entry_store = None
         self.main()
 
     def main(self):
         self._openFile()
-        self._validateFile()
-        self._parseFile()
-        self._populateTable()
-        self._finalise()
+        self._startImport()
 
     def _openFile(self):
         """Open an explorer window to allow the user to select a HAR file to be
@@ -41,239 +49,143 @@ class FileImporter():
         if not self.har_path:
             raise HarImportException
 
-    def _validateFile(self):
-        """File validation. We need to ensure that the user has selected a
-        valid JSON file conforming to the HAR 1.1/1.2 specification."""
+    def _startImport(self):
+        """Start reading the selected file on a background thread."""
 
         self.app.statusbar.showMessage('Importing HAR file...')
         self.import_start = time.time()
+        self.har_size = os.path.getsize(self.har_path)
+
+        # in lazy mode only the fields behind visible columns are extracted up front
+        eager_fields = None
+        if self.app.config.getConfig('lazy-import'):
+            eager_fields = visibleFields(self.app.config)
+
+        self.worker = ImportWorker(self.har_path,
+                                   streaming=self.app.config.getConfig('streaming-import'),
+                                   batch_size=self.app.config.getConfig('import-batch-size'),
+                                   parse_saml=self.app.config.getConfig('parse-saml'),
+                                   eager_fields=eager_fields,
+                                   use_cache=self.app.config.getConfig('sidecar-cache'))
+        self.entry_store = self.worker.entry_store
+        self.worker.batchReady.connect(self._receiveBatch)
+        self.worker.progress.connect(self._updateProgress)
+        self.worker.failed.connect(self._importFailed)
+        self.worker.finished.connect(self._importFinished)
+
+        # only one import at a time
+        self.app.action_open.setEnabled(False)
+        self.app.import_progress.setValue(0)
+        self.app.import_progress.show()
+        self.app.import_cancel_btn.show()
+
+        self.worker.start()
+
+    def cancel(self, wait=False):
+        """Stop the import. Any entries already added to the entries table are removed
+        and the previously loaded HAR file (if any) is restored once the worker stops."""
+        if self.worker.isRunning():
+            self.cancelled = True
+            self.worker.requestInterruption()
+            self.app.statusbar.showMessage('Cancelling import...')
+        if wait:
+            self.worker.wait()
+
+    def _receiveBatch(self, entry_count):
+        if self.cancelled:
+            return
+
+        # the table is only cleared once the file is known to contain entries
+        if self.previous is None:
+            self.previous = (self.app.har_summary, self.app.entry_store, self.app.windowTitle())
+            # the current file keeps its search index until now, so an empty or invalid
+            # file leaves it alone; it is rebuilt if the import is cancelled from here
+            self.app.stopIndexing()
+            self.app.global_searchbox.setReadOnly(True)
+            self.app.entry_store = self.entry_store
+            # entry IDs are only unique within a HAR file
+            self.app.render_cache.clear()
+            clearCache()
+            self._prepareTable()
+
+        self._populateTable(entry_count)
+
+    def _updateProgress(self, entry_count, bytes_read):
+        if self.cancelled:
+            return
+
+        elapsed_time = max(time.time() - self.import_start, 0.001)
+
+        if self.har_size:
+            self.app.import_progress.setValue(int(1000 * bytes_read / self.har_size))
+
+        self.app.statusbar.showMessage('Importing HAR file... {:,} entries ({:,.0f} entries/s), '
+                                       '{:.1f} of {:.1f} MB read'.format(entry_count,
+                                                                         entry_count / elapsed_time,
+                                                                         bytes_read / 1048576,
+                                                                         self.har_size / 1048576))
+
+    def _importFailed(self, message):
+        self.import_error = message
+
+    def _importFinished(self):
+        self.app.import_progress.hide()
+        self.app.import_cancel_btn.hide()
+        self.app.action_open.setEnabled(True)
+        self.app.importer = None
+
+        if self.cancelled:
+            self._restorePrevious()
+        elif not len(self.entry_store):
+            # nothing was imported so the current HAR file is left untouched
+            self.app.statusbar.showMessage(self.import_error)
+        else:
+            self.har_summary = self.worker.har_summary
+            self.app.har_summary = self.har_summary
+            self._finalise()
+
+    def _restorePrevious(self):
+        """Put back the HAR file which was loaded before the cancelled import."""
+        if self.previous is None:
+            self.app.statusbar.showMessage('[OK] Import cancelled.')
+            return
+
+        self.har_summary, self.entry_store, window_title = self.previous
+        self.app.har_summary = self.har_summary
+        self.app.entry_store = self.entry_store
+        self.app.render_cache.clear()
+        clearCache()
 
-        # catch decoding issues
-        try:
-            with open(self.har_path, 'r', encoding='utf-8-sig') as har_file:
-                self.har_raw = json.load(har_file)
-        except json.decoder.JSONDecodeError:
-            self.app.statusbar.showMessage('[ERROR] Unable to import the selected '
-                                           'file due to invalid encoding. Please '
-                                           'check the HAR file for errors.')
-            raise HarImportException
-        except UnicodeDecodeError:
-            self.app.statusbar.showMessage('[ERROR] Unable to import the selected file, '
-                                           'please open a valid HAR file.')
-            raise HarImportException
-
-        # catch syntax issues
-        try:
-            if not self.har_raw['log']['entries']:
-                self.app.statusbar.showMessage('[ERROR] HAR file contains no entries.')
-                raise HarImportException
-        except KeyError:
-            self.app.statusbar.showMessage('[ERROR] HAR file contains no entries.')
-            raise HarImportException
-
-    def _parseFile(self):
-        """Take the raw HAR file and extract the relevant information to be used
-        to populate the entries table and details panels.
-        """
-
-        self.har_summary['log_version'] = self.har_raw['log'].get('version', 'Unknown')
-        self.har_summary['log_creator_name'] = self.har_raw['log'].get('creator', {}).get('name', 'Unknown')
-        self.har_summary['log_creator_version'] = self.har_raw['log'].get('creator', {}).get('version', 'Unknown')
-        self.har_summary['browser_name'] = self.har_raw['log'].get('browser', {}).get('name', 'Unknown')
-        self.har_summary['browser_version'] = self.har_raw['log'].get('browser', {}).get('version', 'Unknown')
-
-        for entry in self.har_raw['log']['entries']:
-
-            entry_parsed = {}
-
-            entry_parsed['startedDateTime'] = entry.get('startedDateTime', '')
-            entry_parsed['time'] = entry.get('time', 0)
-            entry_parsed['serverIPAddress'] = entry.get('serverIPAddress', '')
-            entry_parsed['connection'] = entry.get('connection', '')
-
-            entry_parsed['request_method'] = entry.get('request', {}).get('method', '')
-            entry_parsed['request_url'] = entry.get('request', {}).get('url', '')
-            entry_parsed['request_httpVersion'] = entry.get('request', {}).get('httpVersion', '')
-            entry_parsed['request_cookies'] = entry.get('request', {}).get('cookies', [])
-            entry_parsed['request_headers'] = entry.get('request', {}).get('headers', [])
-            entry_parsed['request_queryString'] = entry.get('request', {}).get('queryString', [])
-            entry_parsed['request_postData'] = entry.get('request', {}).get('postData', {})
-            entry_parsed['request_postData_mimeType'] = entry_parsed['request_postData'].get('mimeType', '')
-            entry_parsed['request_postData_params'] = entry_parsed['request_postData'].get('params', [])
-            entry_parsed['request_postData_text'] = entry_parsed['request_postData'].get('text', '')
-            entry_parsed['request_headersSize'] = entry.get('request', {}).get('headersSize', -1)
-            entry_parsed['request_bodySize'] = entry.get('request', {}).get('bodySize', -1)
-
-            entry_parsed['response_status'] = entry.get('response', {}).get('status', -1)
-            entry_parsed['response_statusText'] = entry.get('response', {}).get('statusText', '')
-            entry_parsed['response_httpVersion'] = entry.get('response', {}).get('httpVersion', '')
-            entry_parsed['response_cookies'] = entry.get('response', {}).get('cookies', [])
-            entry_parsed['response_headers'] = entry.get('response', {}).get('headers', [])
-            entry_parsed['response_content'] = entry.get('response', {}).get('content', [])
-            entry_parsed['response_content_size'] = entry_parsed['response_content'].get('size', -1)
-            entry_parsed['response_content_compression'] = entry_parsed['response_content'].get('compression', -1)
-            entry_parsed['response_content_mimeType'] = entry_parsed['response_content'].get('mimeType', '')
-            entry_parsed['response_content_text'] = entry_parsed['response_content'].get('text', '')
-            entry_parsed['response_content_encoding'] = entry_parsed['response_content'].get('encoding', '')
-            entry_parsed['response_redirectURL'] = entry.get('response', {}).get('redirectURL', '')
-            entry_parsed['response_headersSize'] = entry.get('response', {}).get('headersSize', -1)
-            entry_parsed['response_bodySize'] = entry.get('response', {}).get('bodySize', -1)
-
-            entry_parsed['timings_blocked'] = entry.get('timings', {}).get('blocked', -1)
-            entry_parsed['timings_dns'] = entry.get('timings', {}).get('dns', -1)
-            entry_parsed['timings_connect'] = entry.get('timings', {}).get('connect', -1)
-            entry_parsed['timings_send'] = entry.get('timings', {}).get('send', -1)
-            entry_parsed['timings_wait'] = entry.get('timings', {}).get('wait', -1)
-            entry_parsed['timings_receive'] = entry.get('timings', {}).get('receive', -1)
-            entry_parsed['timings_ssl'] = entry.get('timings', {}).get('ssl', -1)
-
-            # not using cache information at the moment
-
-            #if entry.get('cache', {}).get('beforeRequest', {}) is not None:
-            #    entry_parsed['cache_beforeRequest_expires'] = entry.get('cache', {}).get('beforeRequest', {}).get('expires', '')
-            #    entry_parsed['cache_beforeRequest_lastAccess'] = entry.get('cache', {}).get('beforeRequest', {}).get('lastAccess', '')
-            #    entry_parsed['cache_beforeRequest_eTag'] = entry.get('cache', {}).get('beforeRequest', {}).get('eTag', '')
-            #    entry_parsed['cache_beforeRequest_hitCount'] = entry.get('cache', {}).get('beforeRequest', {}).get('hitCount', -1)
-            #else:
-            #    entry_parsed['cache_beforeRequest_expires'] = 'None'
-            #    entry_parsed['cache_beforeRequest_lastAccess'] = 'None'
-            #    entry_parsed['cache_beforeRequest_eTag'] = 'None'
-            #    entry_parsed['cache_beforeRequest_hitCount'] = 'None'
-
-            #if entry.get('cache', {}).get('afterRequest', {}) is not None:
-            #    entry_parsed['cache_afterRequest_expires'] = entry.get('cache', {}).get('afterRequest', {}).get('expires', '')
-            #    entry_parsed['cache_afterRequest_lastAccess'] = entry.get('cache', {}).get('afterRequest', {}).get('lastAccess', '')
-            #    entry_parsed['cache_afterRequest_eTag'] = entry.get('cache', {}).get('afterRequest', {}).get('eTag', '')
-            #    entry_parsed['cache_afterRequest_hitCount'] = entry.get('cache', {}).get('afterRequest', {}).get('hitCount', -1)
-            #else:
-            #    entry_parsed['cache_afterRequest_expires'] = 'None'
-            #    entry_parsed['cache_afterRequest_lastAccess'] = 'None'
-            #    entry_parsed['cache_afterRequest_eTag'] = 'None'
-            #    entry_parsed['cache_afterRequest_hitCount'] = 'None'
-
-            ##################################
-            # start of custom HAR parsing logic
-            ##################################
-
-            # HAR file may contain unexpected field types
-            if entry_parsed['time'] is None:
-                entry_parsed['time'] = 0
-            if entry_parsed['response_bodySize'] is None:
-                entry_parsed['response_bodySize'] = -1
-
-            # slice up the URL into its components
-            url = urlparse(entry_parsed['request_url'], scheme='Unknown', allow_fragments=False)
-            
-            entry_parsed['request_protocol'] = url.scheme
-            entry_parsed['request_hostname'] = url.hostname
-
-            if url.query:
-                entry_parsed['request_path'] = url.path + '?' + url.query
-            else:
-                entry_parsed['request_path'] = url.path
-
-            if url.port:
-                entry_parsed['request_port'] = url.port
-            elif url.scheme == 'https':
-                entry_parsed['request_port'] = '443'
-            elif url.scheme == 'http':
-                entry_parsed['request_port'] = '80'
-            # TODO use default ports for protocols other than http/s
-            else:
-                entry_parsed['request_port'] = ''
-
-            # extract cookie info from headers if cookies object is empty
-            if not entry_parsed['request_cookies']:
-                entry_parsed['request_cookies'] = self._parseCookies(entry_parsed['request_headers'])
-            if not entry_parsed['response_cookies']:
-                entry_parsed['response_cookies'] = self._parseCookies(entry_parsed['response_headers'])
-
-            # SAML requests and responses
-            entry_parsed['saml_request'] = ''
-            entry_parsed['saml_response'] = ''
-
-            if self.app.config.getConfig('parse-saml'):
-                if entry_parsed['request_queryString']:
-                    entry_parsed['saml_request'] = self._parseSaml(entry_parsed['request_queryString'], 'request')
-                if entry_parsed['request_postData_text']:
-                    entry_parsed['saml_response'] = self._parseSaml(entry_parsed['request_postData_text'], 'response')
-                
-            # HAR files don't have a unique ID for each request so let's make one to be used
-            # for indexing later.
-            uid = ''.join(random.choice(string.ascii_lowercase) for i in range(8))
-
-            ##################################
-            # end of custom HAR parsing logic
-            ##################################
-
-            self.har_parsed[uid] = entry_parsed
+        if self.entry_store is None:
+            self.app.entries_model.setStore(None)
+        else:
+            self._prepareTable()
+            self._populateTable(len(self.entry_store))
+            self._finalise()
 
-        self.app.har_summary = self.har_summary
-        self.app.har_parsed = self.har_parsed
+        self.app.setWindowTitle(window_title)
+        self.app.statusbar.showMessage('[OK] Import cancelled.')
 
-    def _populateTable(self):
-        """Generate the main entries table from the parsed HAR data."""
+    def _prepareTable(self):
+        """Clear the entries table ready for new rows."""
 
         # sorting needs to be disabled here or bad things happen when loading a new HAR file
         self.app.entries_table.setSortingEnabled(False)
+        self.app.entries_model.setStore(self.entry_store)
+        toggleColumnVisibility(self.app)
 
-        column_details = self.app.config.getConfig('table_columns')
-        column_details = sorted(column_details.items(), key=lambda column: column[1]['index'])
-
-        table_headers = [column[1].get('name') for column in column_details]
-
-        self.app.entries_table.setColumnCount(len(table_headers))
-        self.app.entries_table.setHorizontalHeaderLabels(table_headers)
-        self.app.entries_table.setRowCount(0)
-
-        # disable screen painting to reduce flicker
-        self.app.entries_table.setUpdatesEnabled(False)
-
-        row_current = 0
-
-        r = row_current
-        t = self.app.entries_table
-
-        for key, value in self.har_parsed.items():
-            t.insertRow(r)
-            t.setRowHeight(r, 22)
-            t.setItem(r, 0, QTableWidgetItem(key))
-            t.setItem(r, 1, QTableWidgetItem(str(value['startedDateTime'])))
-            t.setItem(r, 2, QTableWidgetItem(str(value['serverIPAddress'])))
-            t.setItem(r, 3, QTableWidgetItem(str(value['connection'])))
-            t.setItem(r, 4, QTableWidgetItem(str(value['request_method']).upper()))
-            t.setItem(r, 5, QTableWidgetItem(str(value['request_protocol']).upper()))
-            t.setItem(r, 6, QTableWidgetItem(str(value['request_hostname'])))
-            t.setItem(r, 7, QTableWidgetItem(str(value['request_port'])))
-            t.setItem(r, 8, QTableWidgetItem(str(value['request_path'])))
-            t.setItem(r, 9, QTableWidgetItem(str(value['request_url'])))
-            t.setItem(r, 10, QTableWidgetItem(str(value['request_httpVersion']).upper()))
-            t.setItem(r, 11, QTableWidgetItem(str(value['response_status'])))
-            t.setItem(r, 12, QTableWidgetItem(str(value['response_statusText'])))
-            t.setItem(r, 13, QTableWidgetItem(str(value['response_content_mimeType']).lower()))
-            t.setItem(r, 14, QTableWidgetItem(str(value['response_httpVersion']).upper()))
-            t.setItem(r, 15, QTableWidgetItem(str(value['response_redirectURL'])))
-            t.setItem(r, 16, HTableWidgetItem(str(int(value['request_headersSize'])), value['request_headersSize']))
-            t.setItem(r, 17, HTableWidgetItem(str(int(value['request_bodySize'])), value['request_bodySize']))
-            t.setItem(r, 18, HTableWidgetItem(str(int(value['response_headersSize'])), value['response_headersSize']))
-            t.setItem(r, 19, HTableWidgetItem(str(int(value['response_bodySize'])), value['response_bodySize']))
-            t.setItem(r, 20, HTableWidgetItem(str(int(value['response_content_size'])), value['response_content_size']))
-            t.setItem(r, 21, HTableWidgetItem(str(int(value['time'])), value['time']))
-            t.setItem(r, 22, HTableWidgetItem(str(int(value['timings_blocked'])), value['timings_blocked']))
-            t.setItem(r, 23, HTableWidgetItem(str(int(value['timings_dns'])), value['timings_dns']))
-            t.setItem(r, 24, HTableWidgetItem(str(int(value['timings_connect'])), value['timings_connect']))
-            t.setItem(r, 25, HTableWidgetItem(str(int(value['timings_send'])), value['timings_send']))
-            t.setItem(r, 26, HTableWidgetItem(str(int(value['timings_wait'])), value['timings_wait']))
-            t.setItem(r, 27, HTableWidgetItem(str(int(value['timings_receive'])), value['timings_receive']))
-            t.setItem(r, 28, HTableWidgetItem(str(int(value['timings_ssl'])), value['timings_ssl']))
-            r += 1
+    def _populateTable(self, entry_count):
+        """Extend the entries table to show the first entry_count entries of the store."""
+        self.app.entries_model.appendEntries(entry_count)
 
     def _finalise(self):
 
         # clear previous search results
+        self.app.cancelGlobalSearch()
         self.app.global_results = None
-        self.app.request_results = None
-        self.app.response_results = None
+        self.app.entry_selector = None
+        self.app.request_search = None
+        self.app.response_search = None
 
         # disable searching actions
         self.app.next_match_entries.setEnabled(False)
@@ -291,6 +203,9 @@ class FileImporter():
         if self.app.config.getConfig('cell-colorization'):
             colourizeCells(self.app)
 
+        # index the entries for global search
+        self.app.startIndexing()
+
         # unlock the search filters
         self.app.global_searchbox.setReadOnly(False)
         self.app.request_filter.setReadOnly(False)
@@ -300,87 +215,158 @@ class FileImporter():
         self.app.request_tabs.setTabEnabled(0, True)
         self.app.response_tabs.setTabEnabled(0, True)
 
+        # enabling sorting sorts by the current sort indicator, so start in file order
+        self.app.entries_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
         self.app.entries_table.setSortingEnabled(True)
         self.app.entries_table.scrollToTop()
         self.app.entries_table.selectRow(0)
         self.app.entries_table.setFocus()
 
-        # turn screen painting back on
-        self.app.entries_table.setUpdatesEnabled(True)
-
-        row_count = self.app.entries_table.rowCount()
+        row_count = self.app.entries_model.rowCount()
         import_stop = time.time()
         elapsed_time = import_stop - self.import_start
 
-        self.app.statusbar.showMessage('[OK] Imported {} entries in {:.1f} seconds'.format(row_count, elapsed_time))
+        if self.import_error:
+            self.app.statusbar.showMessage(self.import_error)
+        else:
+            self.app.statusbar.showMessage('[OK] Imported {} entries in {:.1f} seconds'.format(row_count, elapsed_time))
         self.app.setWindowTitle('Harshark {} | HTTP Archive (HAR) Viewer | {}'.format(self.app.version, self.har_path))
 
-    @staticmethod
-    def _parseCookies(headers):
-        """If there is no cookie object included for a request/response, try to construct
-        one from the HTTP headers if we find Cookie or Set-Cookie headers.
-        """
-        cookie_object = []
 
-        for header in headers:
-            if header['name'].lower() == 'cookie':
-                cookie_object.append(header['value'].split('; '))
-            elif header['name'].lower() == 'set-cookie':
-                cookie_object.append(header['value'].split('\n'))
+class ImportWorker(QThread):
+    """Read and parse a HAR file on a background thread into an EntryStore. Every so
+    often batchReady tells the GUI thread how many entries of the store are complete.
 
-        cookie_object = [item for sublist in cookie_object for item in sublist]
-        return cookie_object
+    With use_cache, an unchanged file which has been imported before is loaded from its
+    sidecar cache (see harcache) instead, and a cache is saved after a full import.
+    """
 
-    @staticmethod
-    def _parseSaml(saml, saml_type):
-        """Decode any SAML request/response messages found in  the query string (HTTP-Redirect binding)
-        or body text (HTTP-POST binding).
-        """
+    batchReady = pyqtSignal(int)
+    progress = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
 
-        if saml_type == 'request':
-            for param in saml:
-                # query strings with no names may be recorded as null in HAR (looking at you Fiddler)
-                if param['name'] is not None and param['name'].lower() == 'samlrequest':
-                    try:
-                        request_encoded = param['value'].replace('%2B', '+') \
-                                                        .replace('%2F', '/') \
-                                                        .replace('%3D', '=') \
-                                                        .replace('%0A', '') \
-                                                        .replace('%0D', '')
-                        request_decoded = b64decode(request_encoded)
-                        request_decompressed = decompress(request_decoded, -15).decode('utf-8')
-                        request_formatted = BeautifulSoup(request_decompressed, 'xml').prettify()
-                        return request_formatted
-                    except:
-                        return 'Couldn\'t parse SAML request.'
-
-        elif saml_type == 'response':
-            saml_response = re.search(r'(?<=SAMLResponse\=)[A-Za-z0-9\%\+\=\/]+', saml)
-            if saml_response:
-                response_encoded = saml_response.group()
-                response_encoded = response_encoded.replace('%2B', '+') \
-                                                   .replace('%2F', '/') \
-                                                   .replace('%3D', '=') \
-                                                   .replace('%0A', '') \
-                                                   .replace('%0D', '')
-                try:
-                    response_decoded = b64decode(response_encoded).decode('utf-8')
-                    response_formatted = BeautifulSoup(response_decoded, 'xml').prettify()
-                    return response_formatted
-                except:
-                    return 'Couldn\'t parse SAML response.'
+    # maximum time to sit on parsed entries before handing them over, in seconds
+    BATCH_INTERVAL = 0.25
+
+    def __init__(self, har_path, streaming=True, batch_size=2000, parse_saml=True,
+                 eager_fields=None, use_cache=False):
+        super().__init__()
+        self.har_path = har_path
+        self.streaming = streaming
+        self.batch_size = batch_size
+        self.parse_saml = parse_saml
+        self.use_cache = use_cache
+        self.har_summary = {}
+        # bodies are left in the file and read from it when needed
+        self.entry_store = EntryStore(eager_fields, parse_saml, har_path)
+        self.entry_count = 0
+        self.bytes_read = 0
+        self.offsets = None
+        self._log = {}
+
+    def run(self):
+        if self.use_cache:
+            # taken before reading, the file may change while it is being imported
+            har_fingerprint = fingerprint(self.har_path, self.parse_saml)
+            if self._loadCache():
+                return
+
+        batch_count = 0
+        last_batch = time.time()
+        error = None
 
-        return ''
+        try:
+            for entry in self._readEntries():
+                if self.isInterruptionRequested():
+                    return
 
+                # HAR files don't have a unique ID for each request, the position of the
+                # entry in the file is used instead
+                try:
+                    self.entry_store.append(entry)
+                except Exception:
+                    # an entry which doesn't look like one, entry IDs have to follow the
+                    # order of the file so stop at it
+                    error = ('[ERROR] Unable to import the selected file, entry {} '
+                             'could not be read.'.format(self.entry_count + 1))
+                    break
+                self.entry_count += 1
+                batch_count += 1
+
+                if batch_count >= self.batch_size or time.time() - last_batch > self.BATCH_INTERVAL:
+                    self.batchReady.emit(self.entry_count)
+                    self.progress.emit(self.entry_count, self.bytes_read)
+                    batch_count = 0
+                    last_batch = time.time()
 
-class HTableWidgetItem(QTableWidgetItem):
-    """Reimplement QTableWidgetItem to allow sorting of numeric columns."""
-    def __init__(self, text, sortKey):
-        QTableWidgetItem.__init__(self, text, QTableWidgetItem.UserType)
-        self.sortKey = sortKey
+        # catch decoding issues
+        except json.decoder.JSONDecodeError:
+            error = ('[ERROR] Unable to import the selected '
+                     'file due to invalid encoding. Please '
+                     'check the HAR file for errors.')
+        except UnicodeDecodeError:
+            error = ('[ERROR] Unable to import the selected file, '
+                     'please open a valid HAR file.')
+        # catch syntax issues
+        except (AttributeError, KeyError, TypeError):
+            error = '[ERROR] HAR file contains no entries.'
+
+        if batch_count:
+            self.batchReady.emit(self.entry_count)
+            self.progress.emit(self.entry_count, self.bytes_read)
+
+        if not self.entry_count:
+            self.failed.emit(error or '[ERROR] HAR file contains no entries.')
+        elif error:
+            self.failed.emit('[ERROR] HAR file is truncated or invalid, only the first '
+                             '{} entries could be imported.'.format(self.entry_count))
+
+        self._summarise()
+
+        # entry offsets are only known when streaming
+        if self.use_cache and self.offsets is not None and not error:
+            saveCache(self.har_path, har_fingerprint, self.entry_store, self.offsets, self.har_summary)
+
+    def _loadCache(self):
+        har_summary = loadCache(self.har_path, self.entry_store, self.parse_saml)
+        if har_summary is None:
+            return False
+
+        self.har_summary = har_summary
+        self.entry_count = len(self.entry_store)
+        self.bytes_read = os.path.getsize(self.har_path)
+        self.batchReady.emit(self.entry_count)
+        self.progress.emit(self.entry_count, self.bytes_read)
+        return True
+
+    def _readEntries(self):
+        """File validation. We need to ensure that the user has selected a
+        valid JSON file conforming to the HAR 1.1/1.2 specification.
 
-    def __lt__(self, other):
-        try:
-            return self.sortKey < other.sortKey
-        except TypeError:
-            return -1
+        In streaming mode entries are decoded one at a time as the file is read,
+        otherwise the whole file is loaded up front.
+        """
+        if self.streaming:
+            har_reader = HarReader(self.har_path)
+            self._log = har_reader.log
+            for entry in har_reader.entries():
+                self.bytes_read = har_reader.bytes_read
+                yield entry
+            self.bytes_read = har_reader.bytes_read
+            self.offsets = har_reader.offsets
+        else:
+            with open(self.har_path, 'r', encoding='utf-8-sig') as har_file:
+                har_raw = json.load(har_file)
+            self.bytes_read = os.path.getsize(self.har_path)
+            # keep the log metadata but not the raw entries
+            self._log = {k: v for k, v in har_raw['log'].items() if k != 'entries'}
+            yield from har_raw['log']['entries'] or []
+
+    def _summarise(self):
+        log = self._log if isinstance(self._log, dict) else {}
+
+        self.har_summary['log_version'] = log.get('version', 'Unknown')
+        self.har_summary['log_creator_name'] = log.get('creator', {}).get('name', 'Unknown')
+        self.har_summary['log_creator_version'] = log.get('creator', {}).get('version', 'Unknown')
+        self.har_summary['browser_name'] = log.get('browser', {}).get('name', 'Unknown')
+        self.har_summary['browser_version'] = log.get('browser', {}).get('version', 'Unknown')
@@ -1,67 +1,45 @@
-import math
-
-from PyQt5.QtGui import QColor
-from PyQt5.QtGui import QBrush
-from PyQt5.QtGui import QTextCharFormat
 from PyQt5.QtGui import QTextCursor
 
-def resizeColumns(app):
-    app.entries_table.resizeColumnsToContents()
-    # TODO fragile, column indexes may change
-    _resizeColumnIfLong(app.entries_table, 8, 800)      # URL path
-    _resizeColumnIfLong(app.entries_table, 9, 800)      # request URL
-    _resizeColumnIfLong(app.entries_table, 15, 800)     # redirect URL
+from bodyviewer import BodyViewer
 
-def _resizeColumnIfLong(table, column_index, new_width):
-    if table.columnWidth(column_index) > new_width:
-        print('Resizing')
-        table.setColumnWidth(column_index, new_width)
-    else:
-        print('Not Resizing')
-
-def _statusCodeFloor(status_code):
-    # e.g. 403 = 400
-    return str(math.floor(int(status_code) / 100) * 100)
+def resizeColumns(app):
+    """Fit each visible column to its header and a sample of its cells: the first and
+    last few rows and the row with the longest value found on import. Columns are
+    capped at the max-width (if any) set for them in the table_columns config."""
+    table = app.entries_table
+    model = app.entries_model
+    header = table.horizontalHeader()
+    grid_width = 1 if table.showGrid() else 0
+
+    row_count = model.rowCount()
+    sample_rows = app.config.getConfig('resize-sample-rows')
+    rows = set(range(min(sample_rows, row_count)))
+    rows.update(range(max(row_count - sample_rows, 0), row_count))
+
+    for column in app.config.getConfig('table_columns').values():
+        column_index = column.get('index')
+        if table.isColumnHidden(column_index):
+            continue
+
+        column_rows = set(rows)
+        widest = model.widestEntry(column_index)
+        if widest is not None and model.rowOfEntry(widest) != -1:
+            column_rows.add(model.rowOfEntry(widest))
+
+        width = header.sectionSizeHint(column_index)
+        for row in column_rows:
+            cell_width = table.sizeHintForIndex(model.index(row, column_index)).width()
+            width = max(width, cell_width + grid_width)
+
+        if column.get('max-width'):
+            width = min(width, column.get('max-width'))
+        table.setColumnWidth(column_index, width)
 
 def decolourizeCells(app):
-    row_count = app.entries_table.rowCount()
-
-    colour_default_hex = app.config.getConfig('colour_scheme')['default']
-    colour_default = QColor(colour_default_hex)
-
-    for row in range(row_count):
-        # TODO fragile, column indexes may change
-        app.entries_table.item(row, 4).setBackground(QColor(colour_default))    # method
-        app.entries_table.item(row, 5).setBackground(QColor(colour_default))    # protocol
-        app.entries_table.item(row, 11).setBackground(QColor(colour_default))   # status code
+    app.entries_model.setColourize(False)
 
 def colourizeCells(app):
-    row_count = app.entries_table.rowCount()
-    method_colours = app.config.getConfig('colour_scheme')['method']
-    protocol_colours = app.config.getConfig('colour_scheme')['protocol']
-    status_code_colours = app.config.getConfig('colour_scheme')['status']
-
-    for row in range(row_count):
-
-        # TODO fragile, column indexes may change
-        method_item = app.entries_table.item(row, 4)
-        protocol_item = app.entries_table.item(row, 5)
-        status_code_item = app.entries_table.item(row, 11)
-
-        # request methods
-        for method, colour in method_colours.items():
-            if method == method_item.text().lower():
-                method_item.setBackground(QColor(colour))
-
-        # request protocol
-        for protocol, colour in protocol_colours.items():
-            if protocol == protocol_item.text().lower():
-                protocol_item.setBackground(QColor(colour))
-
-        # status codes
-        for status_code, colour in status_code_colours.items():
-            if _statusCodeFloor(status_code_item.text()) == status_code:
-                status_code_item.setBackground(QColor(colour))
+    app.entries_model.setColourize(True)
 
 def toggleColumnVisibility(app):
     column_config = app.config.getConfig('table_columns')
@@ -72,19 +50,8 @@ def toggleColumnVisibility(app):
             app.entries_table.hideColumn(v.get('index'))
 
 def clearEntriesSearch(app):
-    column_count =  app.entries_table.columnCount()
-    row_count =  app.entries_table.rowCount()
-
-    colour_match_hex = app.config.getConfig('colour_scheme')['search_match']
-    colour_default_hex = app.config.getConfig('colour_scheme')['default']
-    colour_match = QColor(colour_match_hex).rgb()
-    colour_default = QColor(colour_default_hex)
-
-    for row in range(row_count):
-        for column in range(column_count):
-            cell_colour = app.entries_table.item(row, column).background().color().rgb()
-            if cell_colour == colour_match:
-                app.entries_table.item(row, column).setBackground(colour_default)
+    app.entries_model.clearMatches()
+    app.entries_model.clearFilter()
 
     app.next_match_entries.setEnabled(False)
     app.clear_match_entries.setEnabled(False)
@@ -92,12 +59,6 @@ def clearEntriesSearch(app):
     app.statusbar.clearMessage()
 
 def clearTabSearch(app, tab_group='all'):
-    colour_default_hex = app.config.getConfig('colour_scheme')['default']
-    colour_default = QColor(colour_default_hex)
-
-    eraser = QTextCharFormat()
-    eraser.setBackground(QBrush(colour_default))
-
     if tab_group == 'request':
         tabs = app.request_textedits
         app.statusbar.clearMessage()
@@ -115,27 +76,10 @@ def clearTabSearch(app, tab_group='all'):
         app.clear_match_response_btn.setEnabled(False)
         app.next_match_response_btn.setEnabled(False)
 
+    # matches are highlighted as extra selections, which leave the text untouched
     for tab in tabs:
-        tab.selectAll()
-        cursor = tab.textCursor()
-        cursor.mergeCharFormat(eraser)
-        tab.moveCursor(QTextCursor.Start)
-
-def expandBody(app, body_type):
-    row_id = app.entries_table.item(app.entries_table.currentRow(), 0).text()
-    entry_data = app.har_parsed[row_id]
-
-    if body_type == 'request':
-        clearTabSearch(app, 'request')
-        post_body = entry_data['request_postData_text']
-        app.request_expand_button.hide()
-        app.request_body_tab_text.setPlainText('')
-        app.request_body_tab_text.appendPlainText(post_body)
-        app.request_body_tab_text.moveCursor(QTextCursor.Start)
-    else:
-        clearTabSearch(app, 'response')
-        response_body = entry_data['response_content_text']
-        app.response_expand_button.hide()
-        app.response_body_tab_text.setPlainText('')
-        app.response_body_tab_text.appendPlainText(response_body)
-        app.response_body_tab_text.moveCursor(QTextCursor.Start)
+        if isinstance(tab, BodyViewer):
+            tab.clearMatches()
+        else:
+            tab.setExtraSelections([])
+            tab.moveCursor(QTextCursor.Start)
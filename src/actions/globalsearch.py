@@ -1,16 +1,63 @@
+import itertools
 import time
 
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QColor
+from concurrent.futures.process import BrokenProcessPool
+
+from PyQt5.QtCore import QObject
+from PyQt5.QtCore import QThread
+from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import pyqtSignal
+
 from actions.generic import clearEntriesSearch
+from searchindex import Haystacks
+from searchindex import SearchIndex
+from searchindex import entryText
+from searchindex import indexText
+from searchindex import searchText
+from searchindex import searchShardFile
+
+class GlobalSearch(QObject):
+    """Search every entry for the text in the global search box.
+
+    Queries which scope terms to fields (see searchquery) are checked entry by entry.
+    Large searches which have to scan the text of every entry are split by shard over
+    a pool of processes, and entries which have to be checked one at a time are
+    checked a slice at a time between UI events. The scanned text is casefolded, so
+    for a case-sensitive search whatever the scan finds is checked again the same way.
+    Either way the search may finish asynchronously; matches are highlighted as they
+    come in and the search can be cancelled at any point.
 
-class GlobalSearch():
-    def __init__(self, app):
+    If within is given, only those entries are searched. This is used to narrow down
+    the results of a previous search when more is typed into the search box. A live
+    search, as the user types, leaves the selection and keyboard focus alone.
+    """
+
+    shardDone = pyqtSignal(object, object)
+
+    # use the process pool when there are more bytes than this to scan
+    PARALLEL_SIZE = 1 << 25
+    # seconds to spend checking entries before handling UI events again
+    SCAN_SLICE = 0.05
+
+    def __init__(self, app, query=None, within=None, live=False):
+        super().__init__()
         self.app = app
         self.search_string_a = self.app.global_searchbox.text()
-        self.search_string_b = self.app.global_searchbox.text().casefold()
-        self.column_count = self.app.entries_table.columnCount()
+        self.query = query
+        self.within = within
+        self.live = live
+        self.found_ids = []
         self.found_rows = []
+        self.highlighted = 0
+        self.search_start = None
+        self.search_bytes = None
+        self.case_sensitive = self.app.config.getConfig('case-sensitive-matching')
+        self.plain = True
+        self.pending = set()
+        self.unchecked = None
+        self.cancelled = False
+        self._check = None
+        self.shardDone.connect(self._receiveShard)
         self.main()
 
     def main(self):
@@ -20,69 +67,249 @@ class GlobalSearch():
             return
         else:
             self.app.statusbar.showMessage('Searching...')
-            search_start = time.time()
+            self.search_start = time.time()
             self.searchEntries()
-            self.highlightEntries()
-            match_count = len(self.found_rows)
-            search_stop = time.time()
-            elapsed_time = search_stop - search_start
+
+        if self.unchecked is not None:
+            self._checkSome()
+        else:
+            self._checkFinished()
+
+    def searching(self):
+        """Whether the search is still waiting for results."""
+        return bool(self.pending) or self.unchecked is not None
+
+    def narrows(self, search_string, query, case_sensitive):
+        """Whether every match of a search for search_string, compiled into query, is
+        amongst the results of this (finished) search. Only plain searches narrow."""
+        return (self.plain and not self.cancelled and not self.searching()
+                and self.search_start is not None
+                and case_sensitive == self.case_sensitive
+                and query is None
+                and (self.search_string_a in search_string if case_sensitive
+                     else self.search_string_a.casefold() in search_string.casefold()))
+
+    def cancel(self):
+        """Stop the search, including any shards which haven't been searched yet."""
+        self.cancelled = True
+        for future in self.pending:
+            future.cancel()
+        self.pending = set()
+        self.unchecked = None
+
+    def _checkFinished(self):
+        if not self.searching():
+            self._finishSearch()
+
+    def _finishSearch(self):
+        self.highlightEntries()
+        # optionally hide everything else
+        if self.app.config.getConfig('filter-search-results'):
+            self.app.entries_model.setFilter(self.found_ids)
+        # look up the current table row of each matching entry
+        self.found_rows = sorted(self.app.entries_model.rowOfEntry(k) for k in self.found_ids)
+        match_count = len(self.found_rows)
+        elapsed_time = time.time() - self.search_start
 
         if self.found_rows:
-            self.app.entries_table.selectRow(self.found_rows[0])
-            self.app.entries_table.setFocus()
+            # don't take the focus away from the search box while typing
+            if not self.live:
+                self.app.entries_table.selectRow(self.found_rows[0])
+                self.app.entries_table.setFocus()
             self.app.next_match_entries.setEnabled(True)
             self.app.clear_match_entries.setEnabled(True)
-        
+
         self.app.statusbar.showMessage('Search Result: Found {} matching entries in {:.1f} seconds.'.format(match_count, elapsed_time))
 
     def searchEntries(self):
-        for k, v in self.app.har_parsed.items():
-            found_item = None
-            # list of all values extracted from the entry dictionary
-            master_search = list(self.valuesFromDict(v))
-            if self.app.config.getConfig('case-sensitive-matching'):
-                if self.search_string_a in str(master_search):
-                    # look for entry ID in table and return QTableWidgetItem
-                    found_item = self.app.entries_table.findItems(k, Qt.MatchFlags(Qt.MatchFixedString |
-                                                                                   Qt.MatchCaseSensitive |
-                                                                                   Qt.MatchWrap))[0]
-            else:
-                if self.search_string_b in str(master_search).casefold():
-                    # look for entry ID in table and return QTableWidgetItem
-                    found_item = self.app.entries_table.findItems(k, Qt.MatchFlags(Qt.MatchFixedString |
-                                                                                   Qt.MatchCaseSensitive |
-                                                                                   Qt.MatchWrap))[0]
-            if found_item:
-                found_item_row = self.app.entries_table.row(found_item)
-                self.found_rows.append(found_item_row)
+        entry_count = len(self.app.entry_store)
+        case_sensitive = self.case_sensitive
+        index, haystacks = self.app.searchIndex()
+
+        query = self.query
+        if query is not None:
+            self.plain = False
+            # any unscoped terms are only checked in entries which match the field terms
+            self._checkEntries(range(entry_count), query.text_terms, haystacks,
+                               query.checker(self.app.entry_store))
+            return
+
+        if self.within is not None:
+            self._checkEntries(sorted(self.within), [self.search_string_a], haystacks)
+            return
+
+        candidates = None
+        checked_count = 0
+
+        # entries covered by the index are narrowed down through it first
+        if index is not None:
+            checked_count = min(index.count, entry_count)
+            candidates = index.candidates(self.search_string_a, checked_count)
+            # checking most of the entries one by one is slower than scanning them all
+            if candidates is not None and len(candidates) > checked_count // 4:
+                candidates = None
+
+        scan = candidates is None
+        if scan:
+            checked_count = 0
+            candidates = []
+            if haystacks is not None:
+                checked_count = min(haystacks.count, entry_count)
+
+        # anything not yet indexed or flattened is checked the slow way
+        self._checkEntries(itertools.chain(candidates, range(checked_count, entry_count)),
+                           [self.search_string_a], haystacks)
+
+        if scan and checked_count:
+            # substring search straight through the flattened text of each entry
+            self._searchHaystacks(haystacks, checked_count)
+
+    def _checkEntries(self, entries, search_strings, haystacks, check_fields=None):
+        """Check entries one at a time for all of the search strings, and the field
+        terms of a query if check_fields is given."""
+        case_sensitive = self.case_sensitive
+        check_text = lambda k: all(self._contains(k, search_string, case_sensitive, haystacks)
+                                   for search_string in search_strings)
+        if check_fields is None:
+            self._check = check_text
+        else:
+            self._check = lambda k: check_fields(k) and check_text(k)
+        self._queueChecks(entries)
+
+    def _queueChecks(self, entries):
+        """Add entries to those waiting to be checked by _checkSome."""
+        if self.unchecked is None:
+            self.unchecked = iter(entries)
+        else:
+            self.unchecked = itertools.chain(self.unchecked, entries)
+
+    def _checkSome(self):
+        """Check entries for a while, then let the UI catch up before carrying on."""
+        if self.cancelled or self.unchecked is None:
+            return
+
+        deadline = time.time() + self.SCAN_SLICE
+        check = self._check
+        for i, k in enumerate(self.unchecked):
+            if check(k):
+                self.found_ids.append(k)
+            if not i % 256 and time.time() > deadline:
+                self.highlightEntries()
+                self._showProgress()
+                QTimer.singleShot(0, self._checkSome)
+                return
+
+        self.unchecked = None
+        self._checkFinished()
+
+    def _showProgress(self):
+        self.app.statusbar.showMessage('Searching... {} matching entries found so far.'.format(len(self.found_ids)))
+
+    def _contains(self, k, search_string, case_sensitive, haystacks):
+        """Whether the text of entry k contains the search string."""
+        if haystacks is not None and k < haystacks.count:
+            if not haystacks.contains(k, haystacks.searchBytes(search_string)):
+                return False
+            if not case_sensitive:
+                return True
+            # the haystacks are casefolded, the case has to be checked in the entry itself
+
+        # all values extracted from the entry dictionary
+        master_search = entryText(self.app.entry_store, k)
+        if case_sensitive:
+            return search_string in master_search
+        return search_string.casefold() in master_search.casefold()
+
+    def _searchHaystacks(self, haystacks, count):
+        self.search_bytes = haystacks.searchBytes(self.search_string_a)
+        shards = haystacks.searchable(count)
+
+        search_pool = None
+        if len(shards) > 1 and haystacks.size > self.PARALLEL_SIZE:
+            search_pool = self.app.searchPool()
+
+        if search_pool is not None:
+            try:
+                futures = [(shard, search_pool.submit(searchShardFile, shard.path, shard.starts,
+                                                      shard.end, self.search_bytes))
+                           for shard in shards]
+            except BrokenProcessPool:
+                # a worker process has died, carry on without the pool
+                self.app.stopSearchPool()
+                search_pool = None
+
+        if search_pool is None:
+            for shard in shards:
+                self._addFound(shard.search(self.search_bytes))
+            return
+
+        for shard, future in futures:
+            self.pending.add(future)
+            # called on a pool thread, the signal hands the result over to the GUI thread
+            future.add_done_callback(lambda future, shard=shard: self.shardDone.emit(future, shard))
+
+        self.app.statusbar.showMessage('Searching {} shards...'.format(len(shards)))
+
+    def _receiveShard(self, future, shard):
+        if self.cancelled or future not in self.pending:
+            return
+        self.pending.discard(future)
+
+        try:
+            found = [shard.first + i for i in future.result()]
+        except Exception:
+            # e.g. a worker process died, search the shard here instead
+            found = shard.search(self.search_bytes)
+
+        idle = self.unchecked is None
+        self._addFound(found)
+        if idle and self.unchecked is not None:
+            self._checkSome()
+        elif self.searching():
+            self.highlightEntries()
+            self._showProgress()
+        else:
+            self._finishSearch()
+
+    def _addFound(self, found):
+        """Take the entries found by scanning the haystacks."""
+        if self.case_sensitive:
+            self._queueChecks(found)
+        else:
+            self.found_ids.extend(found)
 
     def highlightEntries(self):
-        # TODO Figure out what is going on with this. The default QColor for cell is black 
-        # but with a value of 0?
-        colour_none = QColor(0, 0, 0).rgb()
-        colour_default_hex = self.app.config.getConfig('colour_scheme')['default']
-        colour_match_hex = self.app.config.getConfig('colour_scheme')['search_match']
-        colour_default = QColor(colour_default_hex).rgb()
-        colour_match = QColor(colour_match_hex)
-
-        for row in self.found_rows:
-            for column in range(self.column_count):
-                cell_colour = self.app.entries_table.item(row, column).background().color().rgb()
-                # only colour cells which haven't already been colourized
-                if cell_colour == colour_none or cell_colour == colour_default:
-                    self.app.entries_table.item(row, column).setBackground(colour_match)
-
-    @staticmethod
-    def valuesFromDict(d):
-          for v in d.values():
-            if v:
-                if isinstance(v, list):
-                    for i in v:
-                        if isinstance(i, dict):
-                            yield from GlobalSearch.valuesFromDict(i)
-                        else:
-                            if i: yield i
-                elif isinstance(v, dict):
-                    yield from GlobalSearch.valuesFromDict(v)
-                else:
-                    yield v
+        # matches come in a few at a time, only highlight the new ones
+        self.app.entries_model.addMatches(self.found_ids[self.highlighted:])
+        self.highlighted = len(self.found_ids)
+
+
+class IndexWorker(QThread):
+    """Flatten the search text of every entry of an EntryStore into Haystacks and build
+    a SearchIndex over it, on a background thread.
+
+    With use_index False only the haystacks are built. If the index grows past
+    index_size bytes it is dropped, and searches scan the haystacks instead.
+    """
+
+    def __init__(self, entry_store, use_index=True, index_size=None):
+        super().__init__()
+        self.entry_store = entry_store
+        self.haystacks = Haystacks()
+        self.index = SearchIndex(index_size) if use_index else None
+
+    def run(self):
+        for k in range(len(self.entry_store)):
+            if self.isInterruptionRequested():
+                return
+            entry = self.entry_store.entry(k, memoise=False)
+            text = searchText(entry)
+            self.haystacks.add(text.casefold())
+
+            index = self.index
+            if index is not None:
+                index_text, truncated = indexText(entry, index.BODY_PREFIX)
+                index.add(k, index_text.casefold(), complete=not truncated)
+                if index.full():
+                    self.index = None
+        self.haystacks.finish()
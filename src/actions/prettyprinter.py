@@ -0,0 +1,105 @@
+from concurrent.futures import CancelledError
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject
+from PyQt5.QtCore import pyqtSignal
+
+from actions.generic import clearTabSearch
+from sizedcache import SizedCache
+from bodyformatter import canPrettyPrint
+from bodyformatter import prettyPrint
+
+class PrettyPrinter(QObject):
+    """Pretty print the bodies of the selected entry on a worker thread.
+
+    The body is shown as captured until it has been formatted. Formatted bodies are
+    kept in a cache bounded by their total length and keyed by entry ID, so going back
+    to an entry shows them straight away. Bodies which can't be formatted are cached as
+    empty strings so they aren't tried again.
+    """
+
+    bodyFormatted = pyqtSignal(object, object)
+
+    # total characters of formatted bodies to keep
+    CACHE_SIZE = 1 << 26
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+        self.entry_store = None
+        self.cache = SizedCache(self.CACHE_SIZE)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = {}
+        # (entry ID, body type) of the body waiting to be shown in each body tab
+        self.showing = {}
+        self.bodyFormatted.connect(self._receiveBody)
+
+    def showBody(self, body_type, entry_id, text, mime_type):
+        """Replace the raw body shown in the body tab with its formatted version, now
+        if it is in the cache or once the worker thread has formatted it. Called for
+        every entry selected, so a body still being formatted for the previous entry
+        isn't shown over this one."""
+        self.showing[body_type] = None
+        if (not text or not self.app.config.getConfig('pretty-print')
+                or not canPrettyPrint(mime_type)):
+            return
+
+        # entry IDs are only unique within a HAR file
+        if self.entry_store is not self.app.entry_store:
+            self.reset()
+            self.entry_store = self.app.entry_store
+
+        key = (entry_id, body_type)
+        formatted = self.cache.get(key)
+        if formatted is not None:
+            if formatted:
+                self._viewer(body_type).setBody(formatted)
+            return
+
+        self.showing[body_type] = key
+        # bodies of entries which were stepped past don't need formatting any more
+        # (cancelling runs the done callback here and now, which may drop the key first)
+        for pending_key, future in list(self.pending.items()):
+            if pending_key not in self.showing.values() and future.cancel():
+                self.pending.pop(pending_key, None)
+
+        if key not in self.pending:
+            future = self.executor.submit(prettyPrint, text, mime_type)
+            self.pending[key] = future
+            # called on the worker thread, the signal hands the result over to the GUI thread
+            future.add_done_callback(lambda future, key=key: self.bodyFormatted.emit(key, future))
+
+    def reset(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending = {}
+        self.showing = {}
+        self.cache.clear()
+
+    def _receiveBody(self, key, future):
+        if self.pending.get(key) is not future:
+            return
+        del self.pending[key]
+
+        try:
+            formatted = future.result() or ''
+        except CancelledError:
+            return
+        except Exception:
+            # e.g. nesting too deep to format, the raw body is good enough
+            formatted = ''
+        self.cache.put(key, formatted)
+
+        entry_id, body_type = key
+        if formatted and self.showing.get(body_type) == key:
+            self.showing[body_type] = None
+            viewer = self._viewer(body_type)
+            # matches found in the raw body would be in the wrong place
+            if viewer.matches:
+                clearTabSearch(self.app, tab_group=body_type)
+            viewer.setBody(formatted)
+
+    def _viewer(self, body_type):
+        if body_type == 'request':
+            return self.app.request_body_tab_text
+        return self.app.response_body_tab_text
@@ -1,17 +1,43 @@
-from PyQt5.QtCore import Qt
+import re
+
 from PyQt5.QtGui import QColor
 from PyQt5.QtGui import QBrush
 from PyQt5.QtGui import QTextCharFormat
 from PyQt5.QtGui import QTextCursor
-from PyQt5.QtWidgets import QTabWidget
+from PyQt5.QtWidgets import QTextEdit
 
 from actions.generic import clearTabSearch
+from bodyviewer import BodyViewer
+from bodyviewer import PositionMap
+
+def searchPattern(search_term, case_sensitive):
+    """A search written as /pattern/ is a regular expression, anything else is matched
+    as it is."""
+    flags = 0 if case_sensitive else re.IGNORECASE
+    if len(search_term) > 2 and search_term.startswith('/') and search_term.endswith('/'):
+        return re.compile(search_term[1:-1], flags)
+    return re.compile(re.escape(search_term), flags)
+
+def findMatches(pattern, text):
+    """(offset, length) of each match of pattern in text, in order."""
+    return [(match.start(), match.end() - match.start())
+            for match in pattern.finditer(text) if match.end() > match.start()]
 
 class SubSearch():
+    """Search the text of the active tab of the request or response panel.
+
+    The text is scanned once and the offset of each match is kept, matches are
+    highlighted as extra selections so the text itself is left untouched and clearing
+    the highlights is just dropping them. Bodies are searched in full, see BodyViewer.
+    """
+
     def __init__(self, app, tab_group):
         self.app = app
         self.tab_group = tab_group
+        self.textedit = None
         self.matches = []
+        self.current = 0
+        self.positions = None
         self.highlight_style = QTextCharFormat()
         self.main()
 
@@ -19,77 +45,74 @@ class SubSearch():
         self._updateBrush()
         clearTabSearch(self.app, tab_group=self.tab_group)
         if self.tab_group == 'request':
-            self._searchRequest()
+            search_term = self.app.request_filter.text()
+            self.textedit = self.app.request_textedits[self.app.request_tabs.currentIndex()]
         elif self.tab_group == 'response':
-            self._searchResponse()
+            search_term = self.app.response_filter.text()
+            self.textedit = self.app.response_textedits[self.app.response_tabs.currentIndex()]
         else:
             raise Exception # TODO: Naked exceptions...
 
-    def _updateBrush(self):
-        colour_match_hex = self.app.config.getConfig('colour_scheme')['search_match']
-        colour_match = QColor(colour_match_hex)
-        self.highlight_style.setBackground(QBrush(colour_match))
-
-    def _searchRequest(self):
+        case_sensitive = self.app.config.getConfig('case-sensitive-matching')
+        try:
+            pattern = searchPattern(search_term, case_sensitive)
+        except re.error as e:
+            self.app.statusbar.showMessage('[ERROR] Invalid regular expression, {}.'.format(e))
+            return
 
-        search_term = self.app.request_filter.text()
-
-        active_tab_index = self.app.request_tabs.currentIndex()
-        active_tab_textedit = self.app.request_textedits[active_tab_index]
-
-        request_matches = []
-
-        active_tab_textedit.moveCursor(QTextCursor.Start)
-
-        # for each match, update the style of the selection
-        while True:
-            match = active_tab_textedit.find(search_term)
-            if match:
-                cursor = active_tab_textedit.textCursor()
-                if cursor.hasSelection():
-                    request_matches.append(cursor)
-                    cursor.mergeCharFormat(self.highlight_style)
-            else:
-                break
+        if isinstance(self.textedit, BodyViewer):
+            self.matches = findMatches(pattern, self.textedit.body)
+            self.textedit.setMatches(self.matches, self.highlight_style)
+        else:
+            text = self.textedit.toPlainText()
+            self.matches = findMatches(pattern, text)
+            self.positions = PositionMap(text)
+            self._highlightMatches()
 
-        match_count = len(request_matches)
-        self.app.statusbar.showMessage('Search Result: Found {} matching entries.'.format(match_count))
+        if not self.matches:
+            self.app.statusbar.showMessage('Search Result: No matches found.')
+            return
 
-        if request_matches:
-            active_tab_textedit.setTextCursor(request_matches[0])
-            active_tab_textedit.setFocus()
-            self.matches = request_matches
+        self._showMatch()
+        if self.tab_group == 'request':
             self.app.clear_match_request_btn.setEnabled(True)
             self.app.next_match_request_btn.setEnabled(True)
+        else:
+            self.app.clear_match_response_btn.setEnabled(True)
+            self.app.next_match_response_btn.setEnabled(True)
 
-    def _searchResponse(self):
-
-        search_term = self.app.response_filter.text()
-
-        active_tab_index = self.app.response_tabs.currentIndex()
-        active_tab_textedit = self.app.response_textedits[active_tab_index]
-
-        response_matches = []
-
-        active_tab_textedit.moveCursor(QTextCursor.Start)
-
-        # for each match, update the style of the selection
-        while True:
-            match = active_tab_textedit.find(search_term)
-            if match:
-                cursor = active_tab_textedit.textCursor()
-                if cursor.hasSelection():
-                    response_matches.append(cursor)
-                    cursor.mergeCharFormat(self.highlight_style)
-            else:
-                break
+    def nextMatch(self):
+        if self.matches:
+            self.current = (self.current + 1) % len(self.matches)
+            self._showMatch()
 
-        match_count = len(response_matches)
-        self.app.statusbar.showMessage('Search Result: Found {} matching entries.'.format(match_count))
+    def _updateBrush(self):
+        colour_match_hex = self.app.config.getConfig('colour_scheme')['search_match']
+        colour_match = QColor(colour_match_hex)
+        self.highlight_style.setBackground(QBrush(colour_match))
 
-        if response_matches:
-            active_tab_textedit.setTextCursor(response_matches[0])
-            active_tab_textedit.setFocus()
-            self.matches = response_matches
-            self.app.clear_match_response_btn.setEnabled(True)
-            self.app.next_match_response_btn.setEnabled(True)
+    def _highlightMatches(self):
+        # all in one go, tabs other than the bodies only hold a little text
+        selections = []
+        for offset, length in self.matches:
+            selection = QTextEdit.ExtraSelection()
+            selection.cursor = self._cursor(offset, length)
+            selection.format = self.highlight_style
+            selections.append(selection)
+        self.textedit.setExtraSelections(selections)
+
+    def _cursor(self, offset, length):
+        cursor = QTextCursor(self.textedit.document())
+        cursor.setPosition(self.positions.position(offset))
+        cursor.setPosition(self.positions.position(offset + length), QTextCursor.KeepAnchor)
+        return cursor
+
+    def _showMatch(self):
+        offset, length = self.matches[self.current]
+        if isinstance(self.textedit, BodyViewer):
+            self.textedit.showOffset(offset, length)
+        else:
+            self.textedit.setTextCursor(self._cursor(offset, length))
+        self.textedit.setFocus()
+        self.app.statusbar.showMessage('Search Result: Match {} of {}.'.format(
+            self.current + 1, len(self.matches)))
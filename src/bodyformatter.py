@@ -0,0 +1,163 @@
+"""Pretty printing of JSON, XML and HTML bodies, chosen by their MIME type. Bodies are
+re-indented rather than re-written, so they still show the values as captured.
+
+Formatting a large body takes a while, so the GUI runs prettyPrint on a worker thread
+(see actions/prettyprinter) and keeps showing the body as captured until it's done.
+"""
+
+import json
+import re
+
+from html.parser import HTMLParser
+from xml.dom import minidom
+from xml.parsers.expat import ExpatError
+
+INDENT = '  '
+
+JSON_TYPES = re.compile(r'^(application|text)/(.*\+)?json\b')
+XML_TYPES = re.compile(r'^(application|text)/(.*\+)?xml\b')
+HTML_TYPES = re.compile(r'^text/html\b')
+
+# strings, punctuation and anything else (numbers and literals) of a JSON document
+JSON_TOKENS = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{},:]|[^\s\[\]{},:"]+')
+JSON_CLOSE = {'{': '}', '[': ']'}
+
+# elements which have no end tag, and elements whose text is kept as it is
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+                 'meta', 'param', 'source', 'track', 'wbr'}
+PREFORMATTED_ELEMENTS = {'pre', 'textarea', 'script', 'style'}
+
+
+def _formatter(mime_type):
+    mime_type = (mime_type or '').lower()
+    if JSON_TYPES.match(mime_type):
+        return _prettyJson
+    if XML_TYPES.match(mime_type):
+        return _prettyXml
+    if HTML_TYPES.match(mime_type):
+        return _prettyHtml
+    return None
+
+def canPrettyPrint(mime_type):
+    return _formatter(mime_type) is not None
+
+def prettyPrint(text, mime_type):
+    """The body formatted for reading, or None if its type isn't one which can be
+    formatted or it doesn't parse as that type."""
+    formatter = _formatter(mime_type)
+    if formatter is None or not text or not text.strip():
+        return None
+    try:
+        return formatter(text)
+    except (ValueError, ExpatError, RecursionError):
+        return None
+
+def _prettyJson(text):
+    # only parsed to check that it is JSON, the tokens are laid out as they are so
+    # numbers and escapes aren't rewritten and repeated keys are kept
+    json.loads(text)
+    tokens = JSON_TOKENS.findall(text)
+    pieces = []
+    depth = 0
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+        if token in JSON_CLOSE:
+            if i < len(tokens) and tokens[i] == JSON_CLOSE[token]:
+                pieces.append(token + tokens[i])
+                i += 1
+                continue
+            depth += 1
+            pieces.append(token + '\n' + INDENT * depth)
+        elif token in ('}', ']'):
+            depth -= 1
+            pieces.append('\n' + INDENT * depth + token)
+        elif token == ',':
+            pieces.append(',\n' + INDENT * depth)
+        elif token == ':':
+            pieces.append(': ')
+        else:
+            pieces.append(token)
+    return ''.join(pieces)
+
+def _prettyXml(text):
+    pretty = minidom.parseString(text).toprettyxml(indent=INDENT)
+    # minidom keeps the whitespace between elements as blank lines
+    lines = [line for line in pretty.splitlines() if line.strip()]
+    # and always adds a declaration
+    if not text.lstrip().startswith('<?xml'):
+        lines = lines[1:]
+    return '\n'.join(lines)
+
+def _prettyHtml(text):
+    indenter = _HtmlIndenter()
+    indenter.feed(text)
+    indenter.close()
+    return '\n'.join(indenter.lines)
+
+
+class _HtmlIndenter(HTMLParser):
+    """Puts each tag of an HTML document on its own line, indented by how deeply it is
+    nested. Text is kept as it is written, character references and all."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.lines = []
+        self.open_tags = []
+        self.text = []
+
+    def _addLine(self, line):
+        self._flushText()
+        self.lines.append(INDENT * len(self.open_tags) + line)
+
+    def _flushText(self):
+        text = ''.join(self.text)
+        self.text = []
+        if PREFORMATTED_ELEMENTS.intersection(self.open_tags):
+            if text.strip():
+                self.lines.append(text.strip('\n'))
+            return
+        for line in text.splitlines():
+            if line.strip():
+                self.lines.append(INDENT * len(self.open_tags) + line.strip())
+
+    def handle_starttag(self, tag, attrs):
+        self._addLine(self.get_starttag_text())
+        if tag not in VOID_ELEMENTS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._addLine(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        self._flushText()
+        # end tags which weren't opened (or are left open, like <p>) are tolerated
+        if tag in self.open_tags:
+            del self.open_tags[len(self.open_tags) - 1 - self.open_tags[::-1].index(tag):]
+        self._addLine('</{}>'.format(tag))
+
+    def handle_data(self, data):
+        self.text.append(data)
+
+    def handle_entityref(self, name):
+        self.text.append('&{};'.format(name))
+
+    def handle_charref(self, name):
+        self.text.append('&#{};'.format(name))
+
+    def handle_comment(self, data):
+        self._addLine('<!--{}-->'.format(data))
+
+    def handle_decl(self, decl):
+        self._addLine('<!{}>'.format(decl))
+
+    def handle_pi(self, data):
+        self._addLine('<?{}>'.format(data))
+
+    def unknown_decl(self, data):
+        self._addLine('<![{}]>'.format(data))
+
+    def close(self):
+        super().close()
+        self._flushText()
@@ -0,0 +1,227 @@
+"""Viewer for request and response bodies, which may be tens of megabytes.
+
+Only a window of the body, about page_size characters, is handed to the text widget
+and laid out at a time. The window moves along as the view is scrolled to either end of
+it, or jumps to any character of the body. Searches run over the whole body string
+rather than the text in the widget, so find matches outside of the current window; only
+the matches in view are highlighted.
+"""
+
+import re
+
+from bisect import bisect_left
+
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtWidgets import QHBoxLayout
+from PyQt5.QtWidgets import QLabel
+from PyQt5.QtWidgets import QPlainTextEdit
+from PyQt5.QtWidgets import QSpinBox
+from PyQt5.QtWidgets import QTextEdit
+from PyQt5.QtWidgets import QWidget
+
+# characters which Qt counts as two, being stored as UTF-16
+ASTRAL = re.compile('[\U00010000-\U0010ffff]')
+
+
+class PositionMap(object):
+    """Converts between offsets in a string and positions in a Qt document of the
+    same text, which differ after any characters outside of the Basic Multilingual
+    Plane (emoji and the like)."""
+
+    def __init__(self, text):
+        self.offsets = [match.start() for match in ASTRAL.finditer(text)]
+        self.positions = [offset + i for i, offset in enumerate(self.offsets)]
+
+    def position(self, offset):
+        if not self.offsets:
+            return offset
+        return offset + bisect_left(self.offsets, offset)
+
+    def offset(self, position):
+        if not self.positions:
+            return position
+        return position - bisect_left(self.positions, position)
+
+
+class BodyViewer(QPlainTextEdit):
+    """Read-only, windowed view of a body. Set the body with setBody (or setPlainText);
+    the navigator widget shows where the window is and jumps to a character offset."""
+
+    def __init__(self, page_size):
+        super().__init__(readOnly=True)
+        self.page_size = max(page_size, 1024)
+        self.body = ''
+        # offsets of the window within the body
+        self.start = 0
+        self.end = 0
+        # (offset, length) of each search match, in order of offset
+        self.matches = []
+        self._match_starts = []
+        self._highlight = None
+        self._positions = PositionMap('')
+        self._moving = False
+        self.navigator = BodyNavigator(self)
+        self.verticalScrollBar().valueChanged.connect(self._scrolled)
+        self.horizontalScrollBar().valueChanged.connect(lambda: self._highlightMatches())
+
+    def setBody(self, body):
+        self.body = body or ''
+        self.clearMatches()
+        self._showWindow(0)
+
+    def setPlainText(self, text):
+        # clearing the tabs clears the whole body, not just the window
+        self.setBody(text)
+
+    def windowed(self):
+        """Whether only part of the body is in the widget."""
+        return self.end - self.start < len(self.body)
+
+    def showOffset(self, offset, length=0):
+        """Move the window to a character of the body (selecting length characters)
+        and scroll it into view."""
+        offset = max(0, min(offset, len(self.body)))
+        if offset < self.start or offset + length > self.end:
+            self._showWindow(offset - self.page_size // 4)
+        self.setTextCursor(self._cursor(offset, length))
+        self.centerCursor()
+
+    def setMatches(self, matches, highlight):
+        """Highlight search matches, as (offset, length) in order of offset within the
+        body, with the highlight text format wherever they are in view."""
+        self.matches = matches
+        self._match_starts = [offset for offset, length in matches]
+        self._highlight = highlight
+        self._highlightMatches()
+
+    def clearMatches(self):
+        self.matches = []
+        self._match_starts = []
+        self.setExtraSelections([])
+
+    def _showWindow(self, start):
+        """Lay out page_size characters of the body from about start, breaking at
+        lines where there are any nearby."""
+        body = self.body
+        snap = self.page_size // 8
+        start = max(0, min(start, len(body) - self.page_size))
+        if start:
+            line_start = body.rfind('\n', start - snap, start)
+            if line_start != -1:
+                start = line_start + 1
+        end = start + self.page_size
+        if end < len(body):
+            line_end = body.find('\n', end, end + snap)
+            if line_end != -1:
+                end = line_end
+        else:
+            end = len(body)
+
+        self.start, self.end = start, end
+        self._moving = True
+        super().setPlainText(body[start:end])
+        self._positions = PositionMap(body[start:end])
+        self._moving = False
+        self._highlightMatches()
+        self.navigator.refresh()
+
+    def _scrolled(self, value):
+        """Move the window along once the view is scrolled to either end of it."""
+        if self._moving:
+            return
+        scroll_bar = self.verticalScrollBar()
+        if value >= scroll_bar.maximum() and self.end < len(self.body):
+            self._moveWindow(self.start + self.page_size // 2)
+        elif value <= scroll_bar.minimum() and self.start > 0:
+            self._moveWindow(self.start - self.page_size // 2)
+        else:
+            self._highlightMatches()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._highlightMatches()
+
+    def _moveWindow(self, start):
+        # keep the text at the top of the view where it is
+        top = self._offsetAt(self.viewport().rect().topLeft())
+        self._showWindow(start)
+        self._moving = True
+        scroll_bar = self.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
+        self.setTextCursor(self._cursor(top))
+        self.ensureCursorVisible()
+        self._moving = False
+        self._highlightMatches()
+        self.navigator.refresh()
+
+    def _offsetAt(self, point):
+        """Offset within the body of the character at a point of the viewport."""
+        return self._positions.offset(self.cursorForPosition(point).position()) + self.start
+
+    def _cursor(self, offset, length=0):
+        """A cursor selecting part of the window, by offsets within the body."""
+        cursor = QTextCursor(self.document())
+        position = self._positions.position
+        cursor.setPosition(position(min(max(offset - self.start, 0), self.end - self.start)))
+        if length:
+            cursor.setPosition(position(min(offset + length, self.end) - self.start),
+                               QTextCursor.KeepAnchor)
+        return cursor
+
+    def _highlightMatches(self):
+        """Highlight the matches in view. There may be many thousands of matches in a
+        window, which would slow down painting if they were all extra selections."""
+        if self._moving:
+            return
+        selections = []
+        if self.matches:
+            viewport = self.viewport().rect()
+            first = max(self._offsetAt(viewport.topLeft()), self.start)
+            last = min(self._offsetAt(viewport.bottomRight()), self.end)
+            # matches which start above the view may run into it
+            i = bisect_left(self._match_starts, first - self.page_size // 8)
+            for offset, length in self.matches[i:]:
+                if offset > last:
+                    break
+                if offset + length < first:
+                    continue
+                selection = QTextEdit.ExtraSelection()
+                selection.cursor = self._cursor(offset, length)
+                selection.format = self._highlight
+                selections.append(selection)
+        self.setExtraSelections(selections)
+
+
+class BodyNavigator(QWidget):
+    """Shows which part of a windowed body is in view, with a box to jump to any
+    character of it. Hidden when the whole body fits in the window."""
+
+    def __init__(self, viewer):
+        super().__init__()
+        self.viewer = viewer
+        self.position_label = QLabel()
+        self.offset_box = QSpinBox(keyboardTracking=False, toolTip='Jump to a character of the body')
+        # without keyboard tracking, only once a new offset has been entered
+        self.offset_box.valueChanged.connect(viewer.showOffset)
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.position_label)
+        layout.addStretch()
+        layout.addWidget(QLabel('Go to character:'))
+        layout.addWidget(self.offset_box)
+        self.setLayout(layout)
+        self.hide()
+
+    def refresh(self):
+        viewer = self.viewer
+        if not viewer.windowed():
+            self.hide()
+            return
+        self.position_label.setText('Showing characters {:,} to {:,} of {:,}'.format(
+            viewer.start, viewer.end, len(viewer.body)))
+        self.offset_box.blockSignals(True)
+        self.offset_box.setMaximum(len(viewer.body))
+        self.offset_box.setValue(viewer.start)
+        self.offset_box.blockSignals(False)
+        self.show()
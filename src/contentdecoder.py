@@ -0,0 +1,103 @@
+"""Decoding of response content recorded in an encoding (content.encoding), usually
+base64 for binary responses.
+
+Content is only decoded when it is looked at, either to show it or because a search asks
+for decoded content. Decoded content is kept in a cache bounded by its total size, as
+the same response tends to be looked at more than once. The cache is keyed by entry ID,
+so it is cleared (see clearCache) whenever another HAR file is loaded.
+"""
+
+import binascii
+import codecs
+import re
+
+from base64 import b64decode
+from collections import namedtuple
+
+from sizedcache import SizedCache
+
+def _base64(text):
+    # line breaks are allowed, anything else which isn't base64 is an error
+    return b64decode(''.join(text.split()), validate=True)
+
+# decoders for each content.encoding, anything else is shown as it is
+DECODERS = {
+    'base64': _base64,
+}
+
+# text is whatever is left of the content once decoded, binary content is shown as a
+# hex dump of (no more than) the first BINARY_PREVIEW bytes
+DecodedContent = namedtuple('DecodedContent', 'text binary size')
+
+BINARY_PREVIEW = 1 << 12
+
+# total characters of decoded content to keep
+CACHE_SIZE = 1 << 25
+
+# bytes found in text, anything else means the content is binary
+TEXT_BYTES = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7f})
+
+TEXT_TYPES = re.compile(r'^(text/|application/(.*\+)?(json|xml|javascript|x-www-form-urlencoded))')
+
+CHARSET = re.compile(r'charset\s*=\s*"?([\w.:-]+)', re.IGNORECASE)
+
+
+_cache = SizedCache(CACHE_SIZE, lambda decoded: len(decoded.text))
+
+
+def decodeContent(text, encoding, mime_type='', key=None):
+    """The content of a response as it should be shown or searched. Decoded content is
+    cached under key, usually (entry ID, field), if one is given."""
+    decoder = DECODERS.get((encoding or '').lower())
+    if decoder is None or not text:
+        return DecodedContent(text, False, len(text or ''))
+
+    decoded = None if key is None else _cache.get(key)
+    if decoded is None:
+        decoded = _decode(text, decoder, mime_type or '')
+        if key is not None:
+            _cache.put(key, decoded)
+    return decoded
+
+def clearCache():
+    """Forget decoded content, entry IDs are only unique within a HAR file."""
+    _cache.clear()
+
+def _decode(text, decoder, mime_type):
+    try:
+        data = decoder(text)
+    except (binascii.Error, ValueError):
+        # not what it claims to be, show it as it is
+        return DecodedContent(text, False, len(text))
+
+    if _isText(data, mime_type):
+        return DecodedContent(data.decode(_charset(mime_type), errors='replace'), False, len(data))
+    return DecodedContent(_hexDump(data, mime_type), True, len(data))
+
+def _isText(data, mime_type):
+    if TEXT_TYPES.match(mime_type.lower()):
+        return True
+    return not data[:BINARY_PREVIEW].translate(None, TEXT_BYTES)
+
+def _charset(mime_type):
+    match = CHARSET.search(mime_type)
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+def _hexDump(data, mime_type):
+    summary = 'Binary content, {:,} bytes'.format(len(data))
+    if mime_type:
+        summary += ' ({})'.format(mime_type)
+    lines = [summary, '']
+    for offset in range(0, min(len(data), BINARY_PREVIEW), 16):
+        row = data[offset:offset + 16]
+        hex_bytes = ' '.join('{:02x}'.format(byte) for byte in row)
+        printable = ''.join(chr(byte) if 0x20 <= byte < 0x7f else '.' for byte in row)
+        lines.append('{:08x}  {:<47}  {}'.format(offset, hex_bytes, printable))
+    if len(data) > BINARY_PREVIEW:
+        lines.append('. . .')
+    return '\n'.join(lines)
@@ -0,0 +1,453 @@
+import re
+
+from array import array
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+from PyQt5.QtCore import QAbstractTableModel
+from PyQt5.QtCore import QModelIndex
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QBrush
+from PyQt5.QtGui import QColor
+
+from entrystore import NUMERIC_FIELDS
+from entrystore import StringColumn
+
+
+def _text(value):
+    return str(value)
+
+def _upper(value):
+    return str(value).upper()
+
+def _lower(value):
+    return str(value).lower()
+
+def _number(value):
+    try:
+        return str(int(value))
+    except (OverflowError, TypeError, ValueError):
+        return str(value)
+
+def _fraction(match):
+    # fromisoformat only takes fractions of 3 or 6 digits before Python 3.11
+    return '.' + match.group(1)[:6].ljust(6, '0')
+
+def _timestamp(started):
+    """An ISO 8601 date as microseconds since the epoch, -1 if it can't be parsed."""
+    try:
+        started = FRACTION.sub(_fraction, started.replace('Z', '+00:00'), count=1)
+        # and only offsets with a colon
+        moment = datetime.fromisoformat(OFFSET.sub(r'\1:\2', started))
+    except (AttributeError, ValueError):
+        return -1
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+def _statusCodeFloor(status_code):
+    # e.g. 403 = 400
+    try:
+        return str(int(status_code) // 100 * 100)
+    except (TypeError, ValueError):
+        return ''
+
+
+# (parsed entry key, cell formatter, numeric) for each column of the entries table. The
+# position of each column matches its index in the table_columns config. Column 0 shows
+# the entry ID rather than a field of the entry.
+COLUMNS = [
+    (None, _text, True),
+    ('startedDateTime', _text, False),
+    ('serverIPAddress', _text, False),
+    ('connection', _text, False),
+    ('request_method', _upper, False),
+    ('request_protocol', _upper, False),
+    ('request_hostname', _text, False),
+    ('request_port', _text, False),
+    ('request_path', _text, False),
+    ('request_url', _text, False),
+    ('request_httpVersion', _upper, False),
+    ('response_status', _text, False),
+    ('response_statusText', _text, False),
+    ('response_content_mimeType', _lower, False),
+    ('response_httpVersion', _upper, False),
+    ('response_redirectURL', _text, False),
+    ('request_headersSize', _number, True),
+    ('request_bodySize', _number, True),
+    ('response_headersSize', _number, True),
+    ('response_bodySize', _number, True),
+    ('response_content_size', _number, True),
+    ('time', _number, True),
+    ('timings_blocked', _number, True),
+    ('timings_dns', _number, True),
+    ('timings_connect', _number, True),
+    ('timings_send', _number, True),
+    ('timings_wait', _number, True),
+    ('timings_receive', _number, True),
+    ('timings_ssl', _number, True),
+]
+
+def visibleFields(config):
+    """Entry fields behind the currently visible columns of the entries table."""
+    column_config = config.getConfig('table_columns')
+    visible = [v.get('index') for v in column_config.values() if v.get('visible')]
+    return [COLUMNS[index][0] for index in visible if COLUMNS[index][0] is not None]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# fractions of a second, and UTC offsets written without a colon
+FRACTION = re.compile(r'\.(\d+)')
+OFFSET = re.compile(r'([+-]\d\d)(\d\d)$')
+
+# text fields which sort by a number derived from them, field: (typecode, sort key)
+SORT_KEYS = {
+    'startedDateTime': ('q', _timestamp),
+}
+
+# TODO fragile, column indexes may change
+METHOD_COLUMN = 4
+PROTOCOL_COLUMN = 5
+STATUS_COLUMN = 11
+
+# columns coloured by the value of a field when colourization is on
+# column: (field, colour_scheme key, colour_scheme lookup key of the field value)
+COLOUR_COLUMNS = {
+    METHOD_COLUMN: ('request_method', 'method', _lower),
+    PROTOCOL_COLUMN: ('request_protocol', 'protocol', _lower),
+    STATUS_COLUMN: ('response_status', 'status', _statusCodeFloor),
+}
+
+# field value each status colour class stands for, the class of a status is status // 100
+STATUS_CLASSES = [status_class * 100 for status_class in range(10)]
+
+# bits of the per-entry state
+MATCHED = 1
+
+
+class EntriesModel(QAbstractTableModel):
+    """Table model serving the entries table straight from an EntryStore. Cells are
+    formatted only when the view asks for them, so no per-cell objects are created no
+    matter how many entries are loaded.
+
+    self.sorted holds every entry in the current sort order. Table rows map to entries
+    in the store through self.order, which is self.sorted less any entries hidden by a
+    filter, and self.rows maps back from an entry to its current row (-1 if hidden). The
+    reverse mapping is only rebuilt after a sort or filter when it is next asked for.
+    """
+
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+        self.store = None
+        self.sorted = array('L')
+        self.order = array('L')
+        self.rows = array('l')
+        self.shown = None
+        self.colourize = False
+        self.state = bytearray()
+        self.matches = []
+        self.status_classes = bytearray()
+        self.widest = {}
+        self.sort_keys = {}
+        self._headers = []
+        self._loadHeaders()
+        self.loadColourScheme()
+
+    def _loadHeaders(self):
+        column_details = self.config.getConfig('table_columns')
+        column_details = sorted(column_details.items(), key=lambda column: column[1]['index'])
+        self._headers = [column[1].get('name') for column in column_details]
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self._headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        entry = self.order[index.row()]
+        column = index.column()
+
+        if role == Qt.DisplayRole:
+            field, formatter, numeric = COLUMNS[column]
+            if field is None:
+                return str(entry)
+            return formatter(self.store.column(field)[entry])
+
+        if role == Qt.BackgroundRole:
+            return self._cellBrush(entry, column)
+
+        return None
+
+    def _cellBrush(self, entry, column):
+        brush = None
+
+        if self.colourize and column in COLOUR_COLUMNS:
+            brush = self._classBrush(column, entry)
+
+        # search matches don't override cells which have already been colourized
+        if self.state[entry] & MATCHED and (brush is None or brush is self._default_brush):
+            brush = self._match_brush
+
+        return brush
+
+    def _colourClasses(self, column):
+        """Colour class code of every entry for a colour column, and the field value
+        each code stands for."""
+        if column == STATUS_COLUMN:
+            return self.status_classes, STATUS_CLASSES
+        field, scheme, key = COLOUR_COLUMNS[column]
+        values = self.store.column(field)
+        return values.codes, values.values
+
+    def _classBrush(self, column, entry):
+        codes, values = self._colourClasses(column)
+        code = codes[entry]
+
+        # each colour class is only looked up in the colour scheme once
+        brushes = self._class_brushes.setdefault(column, [])
+        if code >= len(brushes):
+            field, scheme, key = COLOUR_COLUMNS[column]
+            colours = self._colour_scheme[scheme]
+            brushes.extend(self._brush(colours.get(key(value)))
+                           for value in values[len(brushes):code + 1])
+        return brushes[code]
+
+    def _brush(self, colour):
+        """The one shared brush for a colour."""
+        if not colour:
+            return None
+        brush = self._brushes.get(colour)
+        if brush is None:
+            brush = self._brushes[colour] = QBrush(QColor(colour))
+        return brush
+
+    def loadColourScheme(self):
+        """(Re)load the colour_scheme config. Only the brushes for the few colours in
+        the scheme are rebuilt, the colour class of each entry stays as it is."""
+        self._colour_scheme = self.config.getConfig('colour_scheme')
+        self._brushes = {}
+        self._class_brushes = {}
+        self._default_brush = self._brush(self._colour_scheme['default'])
+        self._match_brush = self._brush(self._colour_scheme['search_match'])
+        self._refresh()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Sort the entries by a column. A column of -1 restores file order.
+
+        Sorting is stable, so entries with equal values keep the order of the previous
+        sort. Sorting by one column and then another sorts by both.
+        """
+        self.layoutAboutToBeChanged.emit()
+        old_order = self.order
+
+        if column < 0:
+            self.sorted = array('L', range(len(self.sorted)))
+        else:
+            keys = self._sortKeys(column)
+            key = None if keys is None else keys.__getitem__
+            self.sorted = array('L', sorted(self.sorted, key=key,
+                                            reverse=(order == Qt.DescendingOrder)))
+        self._mapRows()
+
+        # keep the selection on the same entries
+        old_indexes = self.persistentIndexList()
+        if old_indexes:
+            rows = self._rowMap()
+            new_indexes = [self.index(rows[old_order[index.row()]], index.column())
+                           for index in old_indexes]
+            self.changePersistentIndexList(old_indexes, new_indexes)
+
+        self.layoutChanged.emit()
+
+    def _mapRows(self):
+        if self.shown is None:
+            self.order = array('L', self.sorted)
+        else:
+            self.order = array('L', (entry for entry in self.sorted if entry in self.shown))
+        # worked out again when next needed, many sorts never need it
+        self.rows = None
+
+    def _rowMap(self):
+        if self.rows is None:
+            rows = array('l', [-1]) * len(self.sorted)
+            for row, entry in enumerate(self.order):
+                rows[entry] = row
+            self.rows = rows
+        return self.rows
+
+    def _sortKeys(self, column):
+        """The sort key of every entry for a column, indexed by entry. Keys are worked
+        out once, so sorting only compares plain numbers or strings. Returns None when
+        entries sort by their ID."""
+        field, formatter, numeric = COLUMNS[column]
+        if field is None:
+            return None
+
+        values = self.store.column(field)
+        count = len(self.sorted)
+
+        if field in NUMERIC_FIELDS:
+            return values
+
+        if isinstance(values, StringColumn):
+            # rank the distinct values, then each entry sorts by the rank of its value
+            ranks = [0] * len(values.values)
+            distinct = [formatter(value) for value in values.values]
+            for rank, code in enumerate(sorted(range(len(distinct)), key=distinct.__getitem__)):
+                ranks[code] = rank
+            return array('L', map(ranks.__getitem__, values.codes[:count]))
+
+        # only entries added since the column was last sorted need new keys
+        typecode, key = SORT_KEYS.get(field, (None, formatter))
+        keys = self.sort_keys.get(column)
+        if keys is None:
+            keys = self.sort_keys[column] = [] if typecode is None else array(typecode)
+        keys.extend(map(key, values[len(keys):count]))
+        return keys
+
+    def setStore(self, store):
+        """Replace the entries shown in the table. Rows are added with appendEntries."""
+        self.beginResetModel()
+        self._loadHeaders()
+        self.store = store
+        self.sorted = array('L')
+        self.order = array('L')
+        self.rows = array('l')
+        self.shown = None
+        self.state = bytearray()
+        self.matches = []
+        self.status_classes = bytearray()
+        self.widest = {}
+        self.sort_keys = {}
+        self._class_brushes = {}
+        self.endResetModel()
+
+    def appendEntries(self, entry_count):
+        """Show rows for the first entry_count entries in the store."""
+        first = len(self.sorted)
+        if entry_count <= first:
+            return
+        self.sorted.extend(range(first, entry_count))
+        self.state.extend(bytes(entry_count - first))
+        statuses = self.store.column('response_status')
+        self.status_classes.extend(status // 100 if 0 < status < 1000 else 0
+                                   for status in statuses[first:entry_count])
+        self._trackWidest(first, entry_count)
+        if self.shown is not None:
+            # entries can't match a filter applied before they were added
+            if self.rows is not None:
+                self.rows.extend(array('l', [-1]) * (entry_count - first))
+            return
+
+        first_row = len(self.order)
+        self.beginInsertRows(QModelIndex(), first_row, first_row + entry_count - first - 1)
+        # new entries are always added to the bottom of the table, even when sorted
+        self.order.extend(range(first, entry_count))
+        if self.rows is not None:
+            self.rows.extend(range(first_row, first_row + entry_count - first))
+        self.endInsertRows()
+
+    def _trackWidest(self, first, end):
+        """Keep track of the entry with the longest value in each column, so column
+        widths can be fitted without measuring every row. Only columns the store already
+        holds are looked at, hidden columns aren't extracted just for this."""
+        for column, (field, formatter, numeric) in enumerate(COLUMNS):
+            values = self.store.columns.get(field)
+            if values is None:
+                continue
+
+            if isinstance(values, StringColumn):
+                # measure each distinct value once
+                lengths = [len(formatter(value)) for value in values.values]
+                codes = values.codes[first:end]
+                code = max(codes, key=lengths.__getitem__)
+                length, entry = lengths[code], first + codes.index(code)
+            elif field in NUMERIC_FIELDS:
+                batch = values[first:end]
+                value = max(batch)
+                length, entry = len(formatter(value)), first + batch.index(value)
+            else:
+                lengths = list(map(len, map(str, values[first:end])))
+                length = max(lengths)
+                entry = first + lengths.index(length)
+
+            if length > self.widest.get(column, (-1, None))[0]:
+                self.widest[column] = (length, entry)
+
+    def widestEntry(self, column):
+        """The entry with the longest value in a column, or None if it isn't known."""
+        return self.widest.get(column, (None, None))[1]
+
+    def entryId(self, row):
+        """ID (position in the store) of the entry shown in a table row."""
+        return self.order[row]
+
+    def entry(self, row):
+        return self.store.entry(self.order[row])
+
+    def rowOfEntry(self, entry):
+        """Current table row of an entry, or -1 if it is hidden by a filter."""
+        return self._rowMap()[entry]
+
+    def setFilter(self, entries):
+        """Only show the given entries in the table."""
+        self.beginResetModel()
+        self.shown = set(entries)
+        self._mapRows()
+        self.endResetModel()
+
+    def clearFilter(self):
+        if self.shown is not None:
+            self.beginResetModel()
+            self.shown = None
+            self._mapRows()
+            self.endResetModel()
+
+    def setColourize(self, colourize):
+        self.colourize = colourize
+        self._refresh()
+
+    def setMatches(self, entries):
+        self._clearMatched()
+        self.addMatches(entries)
+
+    def addMatches(self, entries):
+        """Highlight more search matches, in time proportional to the number added."""
+        entries = list(entries)
+        state = self.state
+        for entry in entries:
+            state[entry] |= MATCHED
+        self.matches.extend(entries)
+        self._refresh()
+
+    def clearMatches(self):
+        if self.matches:
+            self._clearMatched()
+            self._refresh()
+
+    def _clearMatched(self):
+        state = self.state
+        for entry in self.matches:
+            state[entry] &= ~MATCHED
+        self.matches = []
+
+    def _refresh(self):
+        """Ask the view to repaint every cell; only visible cells are actually redrawn."""
+        if self.order:
+            self.dataChanged.emit(self.index(0, 0),
+                                  self.index(len(self.order) - 1, len(COLUMNS) - 1),
+                                  [Qt.BackgroundRole])
@@ -0,0 +1,356 @@
+import mmap
+import threading
+
+from array import array
+from functools import lru_cache
+from json.decoder import scanstring
+
+from harfields import BODY_FIELDS
+from harfields import EXTRACTORS
+
+# numeric fields are held in typed arrays, missing or invalid values are stored as -1
+NUMERIC_FIELDS = {
+    'time': 'd',
+    'request_headersSize': 'd',
+    'request_bodySize': 'd',
+    'response_status': 'l',
+    'response_content_size': 'd',
+    'response_content_compression': 'd',
+    'response_headersSize': 'd',
+    'response_bodySize': 'd',
+    'timings_blocked': 'd',
+    'timings_dns': 'd',
+    'timings_connect': 'd',
+    'timings_send': 'd',
+    'timings_wait': 'd',
+    'timings_receive': 'd',
+    'timings_ssl': 'd',
+    'has_saml': 'B',
+}
+
+# short strings which repeat across many entries, each distinct value is stored once
+STRING_FIELDS = (
+    'serverIPAddress',
+    'connection',
+    'request_method',
+    'request_httpVersion',
+    'request_protocol',
+    'request_hostname',
+    'request_port',
+    'request_postData_mimeType',
+    'response_statusText',
+    'response_httpVersion',
+    'response_content_mimeType',
+    'response_content_encoding',
+)
+
+# strings which are (mostly) unique to each entry
+TEXT_FIELDS = (
+    'startedDateTime',
+    'request_url',
+    'request_path',
+    'response_redirectURL',
+)
+
+# bodies (BODY_FIELDS) are held in BodyColumns, and are always extracted up front as
+# they are the bulk of each raw entry
+
+# lists of name/value objects, the strings inside them are shared between entries
+OBJECT_FIELDS = (
+    'request_cookies',
+    'request_headers',
+    'request_queryString',
+    'request_postData_params',
+    'response_cookies',
+    'response_headers',
+)
+
+
+def _identity(value):
+    return value
+
+def _intRange(typecode):
+    bits = 8 * array(typecode).itemsize
+    if typecode.isupper():
+        return 0, 1 << bits
+    return -(1 << bits - 1), 1 << bits - 1
+
+# values which fit in each integer typecode of NUMERIC_FIELDS, as [low, high)
+INT_RANGES = {typecode: _intRange(typecode)
+              for typecode in set(NUMERIC_FIELDS.values()) if typecode != 'd'}
+
+def _toNumber(value, typecode):
+    try:
+        if typecode == 'd':
+            return float(value)
+        number = int(value)
+    except (OverflowError, TypeError, ValueError):
+        # e.g. Infinity, or an integer too large to be a float
+        return -1
+    low, high = INT_RANGES[typecode]
+    # too large for the typed array to hold
+    if not low <= number < high:
+        return -1
+    return number
+
+def _truncate(column, count):
+    """Cut a column back to its first count rows."""
+    if isinstance(column, (StringColumn, BodyColumn)):
+        column.truncate(count)
+    else:
+        del column[count:]
+
+
+class StringColumn(object):
+    """A column of repeated values. Each distinct value is stored once and rows hold
+    an integer code into the list of distinct values."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = array('L')
+        self._lookup = {}
+
+    @classmethod
+    def fromCodes(cls, values, codes):
+        """A column made of previously built lists of distinct values and codes."""
+        column = cls()
+        column.values = values
+        column.codes = codes
+        column._lookup = {value: code for code, value in enumerate(values)}
+        return column
+
+    def append(self, value):
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def truncate(self, count):
+        # distinct values which are no longer used are left, they take no rows
+        del self.codes[count:]
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class BodyColumn(object):
+    """A column of request or response bodies which are left in the HAR file. Rows
+    hold the byte offsets of the JSON string of each body in the file, which is memory
+    mapped, and a body is only decoded when it is asked for.
+
+    Bodies which don't know where they are in the file (see harreader.BodyText), e.g.
+    because the file wasn't streamed, are kept in memory as they are.
+    """
+
+    def __init__(self, path=None, spans=None):
+        self.path = path
+        self.spans = array('Q') if spans is None else spans
+        self.inline = {}
+        self._data = None
+        self._decode = lru_cache(maxsize=8)(self._decodeBody)
+
+    def append(self, value):
+        span = getattr(value, 'span', None)
+        if span is None or self.path is None:
+            if value:
+                self.inline[len(self)] = value
+            span = (0, 0)
+        self.spans.extend(span)
+
+    def truncate(self, count):
+        del self.spans[2 * count:]
+        for row in [row for row in self.inline if row >= count]:
+            del self.inline[row]
+
+    def __getitem__(self, row):
+        start, end = self.spans[2 * row], self.spans[2 * row + 1]
+        if start == end:
+            return self.inline.get(row, '')
+        return self._decode(start, end)
+
+    def __len__(self):
+        return len(self.spans) // 2
+
+    def isEmpty(self, row):
+        """Whether a body is empty, without reading it from the file."""
+        start, end = self.spans[2 * row], self.spans[2 * row + 1]
+        if start == end:
+            return not self.inline.get(row)
+        # just the quotes of an empty string
+        return end - start <= 2
+
+    def _decodeBody(self, start, end):
+        if self._data is None:
+            with open(self.path, 'rb') as har_file:
+                self._data = mmap.mmap(har_file.fileno(), 0, access=mmap.ACCESS_READ)
+        # the span includes the opening quote of the string
+        return scanstring(self._data[start:end].decode('utf-8'), 1)[0]
+
+
+class EntryStore(object):
+    """Compact, column-oriented storage for parsed HAR entries. Entries are addressed
+    by their position in the HAR file, which also serves as the entry ID.
+
+    By default every field is extracted as entries are appended and the raw entries are
+    discarded. If eager_fields is given, only those fields are extracted up front and
+    the raw entries are kept instead; any other column is built the first time it is
+    asked for, and other fields of an entry are extracted (and memoised) the first time
+    the entry is looked at.
+
+    Bodies are always extracted up front. If har_path is given, bodies read from it
+    with their position in the file are left there (see BodyColumn), and are dropped
+    from raw entries.
+
+    Entries are appended from the import thread while the GUI thread reads earlier
+    rows, so an entry only counts towards len() once all of its columns are written.
+    """
+
+    def __init__(self, eager_fields=None, parse_saml=True, har_path=None):
+        self.har_path = har_path
+        self.count = 0
+        self.columns = {}
+        self.raw = None if eager_fields is None else []
+        self._extractors = dict(EXTRACTORS)
+        self._memo = {}
+        self._strings = {}
+        self._lock = threading.Lock()
+        self._plan = []
+
+        if not parse_saml:
+            self._extractors['has_saml'] = lambda e: False
+
+        # SAML is looked for in the request body, which isn't kept in raw entries
+        if eager_fields is not None:
+            eager_fields = set(eager_fields) | set(BODY_FIELDS) | {'has_saml'}
+
+        for field in (EXTRACTORS if eager_fields is None else eager_fields):
+            self.columns[field] = self._newColumn(field)
+        self._planColumns()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def lazy(self):
+        return self.raw is not None
+
+    def append(self, entry):
+        """Add a raw HAR entry to the end of the store. If any field of the entry can't
+        be extracted the store is left as it was and the exception is raised."""
+        with self._lock:
+            try:
+                for append, extract, convert in self._plan:
+                    append(convert(extract(entry)))
+                if self.lazy:
+                    self._dropBodies(entry)
+                    self.raw.append(entry)
+            except Exception:
+                # columns appended to before the failure would be a row out
+                for column in self.columns.values():
+                    _truncate(column, self.count)
+                if self.lazy:
+                    del self.raw[self.count:]
+                raise
+            self.count += 1
+
+    def restore(self, count, columns, raw):
+        """Fill an empty store with previously extracted columns (see harcache). Any
+        other field is extracted from the raw entries when needed, as in lazy mode."""
+        with self._lock:
+            self.columns = columns
+            self.raw = raw
+            self.count = count
+            self._planColumns()
+
+    def _dropBodies(self, entry):
+        """Remove the bodies which are left in the HAR file from a raw entry."""
+        if self.har_path is None:
+            return
+        for holder in BODY_FIELDS.values():
+            body_holder = holder(entry)
+            if isinstance(body_holder, dict) and getattr(body_holder.get('text'), 'span', None):
+                body_holder['text'] = ''
+
+    def _planColumns(self):
+        """Pre-resolve, for every column, how a field is extracted from a raw entry and
+        added to the column so that appending an entry does no field lookups."""
+        self._plan = [(column.append, self._extractors[field], self._converter(field))
+                      for field, column in self.columns.items()]
+
+    def _converter(self, field):
+        if field in NUMERIC_FIELDS:
+            typecode = NUMERIC_FIELDS[field]
+            return lambda value: _toNumber(value, typecode)
+        if field in OBJECT_FIELDS:
+            return self._share
+        return _identity
+
+    def _newColumn(self, field):
+        if field in BODY_FIELDS:
+            return BodyColumn(self.har_path)
+        if field in NUMERIC_FIELDS:
+            return array(NUMERIC_FIELDS[field])
+        if field in STRING_FIELDS:
+            return StringColumn()
+        return []
+
+    def _extract(self, field, entry):
+        return self._converter(field)(self._extractors[field](entry))
+
+    def _share(self, objects):
+        """Replace the strings in a list of name/value objects with a single shared copy
+        of each. Header and cookie names and values are highly repetitive."""
+        strings = self._strings
+        for item in objects:
+            if isinstance(item, dict):
+                for k, v in item.items():
+                    if isinstance(v, str):
+                        item[k] = strings.setdefault(v, v)
+        return objects
+
+    def column(self, field):
+        """Return the column holding a field for every entry, building it first if the
+        field wasn't extracted on import."""
+        column = self.columns.get(field)
+        if column is None:
+            with self._lock:
+                column = self.columns.get(field)
+                if column is None:
+                    column = self._newColumn(field)
+                    extract = self._extractors[field]
+                    convert = self._converter(field)
+                    for entry in self.raw:
+                        column.append(convert(extract(entry)))
+                    self.columns[field] = column
+                    self._planColumns()
+        return column
+
+    def value(self, row, field, memoise=True):
+        column = self.columns.get(field)
+        if column is not None:
+            return column[row]
+
+        memo = self._memo.get(row)
+        if memo is not None and field in memo:
+            return memo[field]
+
+        value = self._extract(field, self.raw[row])
+        if memoise:
+            self._memo.setdefault(row, {})[field] = value
+        return value
+
+    def isEmpty(self, row, field):
+        """Whether a field of an entry is empty. Bodies aren't read to find out."""
+        column = self.columns.get(field)
+        if isinstance(column, BodyColumn):
+            return column.isEmpty(row)
+        return not self.value(row, field)
+
+    def entry(self, row, memoise=True):
+        """Return all fields of an entry as a dictionary. Pass memoise=False when
+        walking over every entry so that lazily extracted fields aren't all kept."""
+        return {field: self.value(row, field, memoise) for field in EXTRACTORS}
@@ -0,0 +1,189 @@
+"""Sidecar cache of the columns extracted from a HAR file.
+
+After a HAR file has been imported, the columns extracted from its entries and the byte
+offsets of each entry within the file are saved next to it in <file>.harshark. When the
+same, unchanged, file is opened again the entries table is loaded straight from the
+cache. Bodies are read from the HAR file, as they are after a full import, and fields
+which aren't cached (headers, cookies...) are parsed from the HAR file one entry at a
+time when they are looked at.
+
+The cache is a fixed size header, a JSON description of the columns and then the raw
+bytes of each typed array, so each array is copied straight out of the (memory mapped)
+file into an array of the same type without any parsing. A cache is only used if the
+size, modification time and a hash sampled from the content of the HAR file all match
+the file it was made from.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+
+from entrystore import OBJECT_FIELDS
+from entrystore import BodyColumn
+from entrystore import StringColumn
+from harreader import HarEntries
+
+MAGIC = b'HARSHARK'
+VERSION = 3
+
+# magic, version, length of the JSON description
+HEADER = struct.Struct('<8sIQ')
+
+# headers and cookies are read from the HAR file when needed
+UNCACHED_FIELDS = OBJECT_FIELDS
+
+# bytes hashed from each of the start, middle and end of the HAR file
+SAMPLE_SIZE = 1 << 16
+
+# sections of the cache start on a multiple of this
+ALIGNMENT = 8
+
+
+def cachePath(har_path):
+    return har_path + '.harshark'
+
+def fingerprint(har_path, parse_saml):
+    """Identify the current content of a HAR file without reading all of it."""
+    stat = os.stat(har_path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(har_path, 'rb') as har_file:
+        for position in (0, stat.st_size // 2, max(stat.st_size - SAMPLE_SIZE, 0)):
+            har_file.seek(position)
+            digest.update(har_file.read(SAMPLE_SIZE))
+
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'hash': digest.hexdigest(),
+        'parse_saml': parse_saml,
+        'byteorder': sys.byteorder,
+    }
+
+def _aligned(size):
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def saveCache(har_path, har_fingerprint, entry_store, offsets, har_summary):
+    """Save the columns of an imported HAR file. Returns False if the cache couldn't be
+    written, e.g. the HAR file is in a read-only directory."""
+    sections = []
+    size = 0
+
+    def addSection(data):
+        nonlocal size
+        start = size
+        sections.append(data)
+        size += len(data)
+        padding = _aligned(size) - size
+        sections.append(bytes(padding))
+        size += padding
+        return start, start + len(data)
+
+    def addArray(values):
+        start, end = addSection(values.tobytes())
+        return {'typecode': values.typecode, 'itemsize': values.itemsize,
+                'start': start, 'end': end}
+
+    columns = {}
+    # the GUI thread may add columns to the store while this runs
+    for field, column in list(entry_store.columns.items()):
+        if field in UNCACHED_FIELDS:
+            continue
+        if isinstance(column, BodyColumn):
+            # only bodies which were left in the HAR file
+            if not column.inline:
+                columns[field] = dict(addArray(column.spans), kind='body')
+        elif isinstance(column, StringColumn):
+            columns[field] = dict(addArray(column.codes), kind='string', values=column.values)
+        elif isinstance(column, array):
+            columns[field] = dict(addArray(column), kind='numeric')
+        elif all(isinstance(value, str) for value in column):
+            text = '\x00'.join(column)
+            # values are separated by NULs so can't contain any themselves
+            if text.count('\x00') != len(column) - 1:
+                continue
+            start, end = addSection(text.encode('utf-8'))
+            columns[field] = {'kind': 'text', 'start': start, 'end': end}
+
+    description = {
+        'fingerprint': har_fingerprint,
+        'count': len(entry_store),
+        'summary': har_summary,
+        'offsets': addArray(offsets),
+        'columns': columns,
+    }
+
+    try:
+        description = json.dumps(description).encode('utf-8')
+    except (TypeError, ValueError):
+        # e.g. a field with values which can't be represented in JSON
+        return False
+    # padded with whitespace so the arrays which follow are aligned
+    description += b' ' * (_aligned(HEADER.size + len(description)) - HEADER.size - len(description))
+
+    # written to one side first so a half written cache is never read
+    temp_path = cachePath(har_path) + '.tmp'
+    try:
+        with open(temp_path, 'wb') as cache_file:
+            cache_file.write(HEADER.pack(MAGIC, VERSION, len(description)))
+            cache_file.write(description)
+            for section in sections:
+                cache_file.write(section)
+        os.replace(temp_path, cachePath(har_path))
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def loadCache(har_path, entry_store, parse_saml):
+    """Fill an empty EntryStore from the cache of a HAR file. Returns the HAR summary,
+    or None if there is no cache or it is out of date."""
+    try:
+        with open(cachePath(har_path), 'rb') as cache_file:
+            with mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, version, length = HEADER.unpack_from(data)
+                if magic != MAGIC or version != VERSION:
+                    return None
+                description = json.loads(data[HEADER.size:HEADER.size + length].decode('utf-8'))
+                if description['fingerprint'] != fingerprint(har_path, parse_saml):
+                    return None
+
+                base = HEADER.size + length
+                offsets = _loadArray(data, base, description['offsets'])
+                columns = {field: _loadColumn(data, base, column, har_path)
+                           for field, column in description['columns'].items()}
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+
+    entry_store.restore(description['count'], columns, HarEntries(har_path, offsets))
+    return description['summary']
+
+def _loadArray(data, base, section):
+    """Copy a section of the cache into a new array, the cache file isn't kept open."""
+    values = array(section['typecode'])
+    if values.itemsize != section['itemsize']:
+        raise ValueError('cache was made on a different platform')
+    values.frombytes(data[base + section['start']:base + section['end']])
+    return values
+
+def _loadColumn(data, base, section, har_path):
+    if section['kind'] == 'numeric':
+        return _loadArray(data, base, section)
+
+    if section['kind'] == 'body':
+        return BodyColumn(har_path, _loadArray(data, base, section))
+
+    if section['kind'] == 'string':
+        return StringColumn.fromCodes(section['values'], _loadArray(data, base, section))
+
+    text = data[base + section['start']:base + section['end']].decode('utf-8')
+    return text.split('\x00')
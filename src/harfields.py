@@ -0,0 +1,204 @@
+"""Extraction of individual fields from raw HAR entries.
+
+Each field shown in the entries table or the details panels has its own extractor so
+that fields can be pulled out of a raw entry independently, either all at once when a
+file is imported or one at a time the first time a field is needed.
+"""
+
+import re
+
+from base64 import b64decode
+from bs4 import BeautifulSoup
+from functools import lru_cache
+from urllib.parse import urlparse
+from zlib import decompress
+
+
+def _request(entry):
+    return entry.get('request', {})
+
+def _response(entry):
+    return entry.get('response', {})
+
+def _postData(entry):
+    return _request(entry).get('postData', {})
+
+def _content(entry):
+    return _response(entry).get('content', {})
+
+def _timings(entry):
+    return entry.get('timings', {})
+
+
+@lru_cache(maxsize=1)
+def _splitUrl(request_url):
+    """Slice up the URL into its components. Consecutive calls for the various parts of
+    the same URL only parse it once."""
+    url = urlparse(request_url, scheme='Unknown', allow_fragments=False)
+
+    if url.query:
+        path = url.path + '?' + url.query
+    else:
+        path = url.path
+
+    if url.port:
+        port = url.port
+    elif url.scheme == 'https':
+        port = '443'
+    elif url.scheme == 'http':
+        port = '80'
+    # TODO use default ports for protocols other than http/s
+    else:
+        port = ''
+
+    return url.scheme, url.hostname, path, port
+
+def _url(entry):
+    return _splitUrl(_request(entry).get('url', ''))
+
+
+def parseCookies(headers):
+    """If there is no cookie object included for a request/response, try to construct
+    one from the HTTP headers if we find Cookie or Set-Cookie headers.
+    """
+    cookie_object = []
+
+    for header in headers:
+        if header['name'].lower() == 'cookie':
+            cookie_object.append(header['value'].split('; '))
+        elif header['name'].lower() == 'set-cookie':
+            cookie_object.append(header['value'].split('\n'))
+
+    cookie_object = [item for sublist in cookie_object for item in sublist]
+    return cookie_object
+
+
+# a SAML response in a POST body (HTTP-POST binding)
+SAML_RESPONSE = re.compile(r'(?<=SAMLResponse\=)[A-Za-z0-9\%\+\=\/]+')
+
+def parseSaml(saml, saml_type):
+    """Decode any SAML request/response messages found in  the query string (HTTP-Redirect binding)
+    or body text (HTTP-POST binding).
+    """
+
+    if saml_type == 'request':
+        for param in saml:
+            # query strings with no names may be recorded as null in HAR (looking at you Fiddler)
+            if param['name'] is not None and param['name'].lower() == 'samlrequest':
+                return _decodeSamlRequest(param['value'])
+
+    elif saml_type == 'response':
+        saml_response = SAML_RESPONSE.search(saml)
+        if saml_response:
+            return _decodeSamlResponse(saml_response.group())
+
+    return ''
+
+
+def _unquoteSaml(encoded):
+    return encoded.replace('%2B', '+') \
+                  .replace('%2F', '/') \
+                  .replace('%3D', '=') \
+                  .replace('%0A', '') \
+                  .replace('%0D', '')
+
+# decoded messages are cached by their encoded form, SSO flows tend to repeat the same
+# messages and an entry is often selected more than once
+@lru_cache(maxsize=64)
+def _decodeSamlRequest(request_encoded):
+    try:
+        request_decoded = b64decode(_unquoteSaml(request_encoded))
+        request_decompressed = decompress(request_decoded, -15).decode('utf-8')
+        request_formatted = BeautifulSoup(request_decompressed, 'xml').prettify()
+        return request_formatted
+    except:
+        return 'Couldn\'t parse SAML request.'
+
+@lru_cache(maxsize=64)
+def _decodeSamlResponse(response_encoded):
+    try:
+        response_decoded = b64decode(_unquoteSaml(response_encoded)).decode('utf-8')
+        response_formatted = BeautifulSoup(response_decoded, 'xml').prettify()
+        return response_formatted
+    except:
+        return 'Couldn\'t parse SAML response.'
+
+
+def hasSaml(entry):
+    """Cheap check for a SAML message in an entry, without decoding it."""
+    for param in _request(entry).get('queryString', []):
+        name = param.get('name')
+        if name is not None and name.lower() == 'samlrequest':
+            return True
+    post_text = _postData(entry).get('text', '')
+    # found the same way as parseSaml does, so the SAML tab is never enabled but empty
+    return bool(post_text) and SAML_RESPONSE.search(post_text) is not None
+
+
+def _requestCookies(entry):
+    # extract cookie info from headers if cookies object is empty
+    return _request(entry).get('cookies', []) or parseCookies(_request(entry).get('headers', []))
+
+def _responseCookies(entry):
+    return _response(entry).get('cookies', []) or parseCookies(_response(entry).get('headers', []))
+
+def _orDefault(value, default):
+    # HAR file may contain unexpected field types
+    return default if value is None else value
+
+
+# field name: extractor, cache information is not used at the moment
+EXTRACTORS = {
+    'startedDateTime': lambda e: e.get('startedDateTime', ''),
+    'time': lambda e: _orDefault(e.get('time', 0), 0),
+    'serverIPAddress': lambda e: e.get('serverIPAddress', ''),
+    'connection': lambda e: e.get('connection', ''),
+
+    'request_method': lambda e: _request(e).get('method', ''),
+    'request_url': lambda e: _request(e).get('url', ''),
+    'request_httpVersion': lambda e: _request(e).get('httpVersion', ''),
+    'request_cookies': _requestCookies,
+    'request_headers': lambda e: _request(e).get('headers', []),
+    'request_queryString': lambda e: _request(e).get('queryString', []),
+    'request_postData_mimeType': lambda e: _postData(e).get('mimeType', ''),
+    'request_postData_params': lambda e: _postData(e).get('params', []),
+    'request_postData_text': lambda e: _postData(e).get('text', ''),
+    'request_headersSize': lambda e: _request(e).get('headersSize', -1),
+    'request_bodySize': lambda e: _request(e).get('bodySize', -1),
+    'request_protocol': lambda e: _url(e)[0],
+    'request_hostname': lambda e: _url(e)[1],
+    'request_path': lambda e: _url(e)[2],
+    'request_port': lambda e: _url(e)[3],
+
+    'response_status': lambda e: _response(e).get('status', -1),
+    'response_statusText': lambda e: _response(e).get('statusText', ''),
+    'response_httpVersion': lambda e: _response(e).get('httpVersion', ''),
+    'response_cookies': _responseCookies,
+    'response_headers': lambda e: _response(e).get('headers', []),
+    'response_content_size': lambda e: _content(e).get('size', -1),
+    'response_content_compression': lambda e: _content(e).get('compression', -1),
+    'response_content_mimeType': lambda e: _content(e).get('mimeType', ''),
+    'response_content_text': lambda e: _content(e).get('text', ''),
+    'response_content_encoding': lambda e: _content(e).get('encoding', ''),
+    'response_redirectURL': lambda e: _response(e).get('redirectURL', ''),
+    'response_headersSize': lambda e: _response(e).get('headersSize', -1),
+    'response_bodySize': lambda e: _orDefault(_response(e).get('bodySize', -1), -1),
+
+    'timings_blocked': lambda e: _timings(e).get('blocked', -1),
+    'timings_dns': lambda e: _timings(e).get('dns', -1),
+    'timings_connect': lambda e: _timings(e).get('connect', -1),
+    'timings_send': lambda e: _timings(e).get('send', -1),
+    'timings_wait': lambda e: _timings(e).get('wait', -1),
+    'timings_receive': lambda e: _timings(e).get('receive', -1),
+    'timings_ssl': lambda e: _timings(e).get('ssl', -1),
+
+    # SAML messages are only decoded when an entry is selected
+    'has_saml': hasSaml,
+}
+
+# fields holding request and response bodies, usually most of a HAR file by far, and
+# the part of an entry which holds each of them as its text
+BODY_FIELDS = {
+    'request_postData_text': _postData,
+    'response_content_text': _content,
+}
@@ -0,0 +1,249 @@
+import codecs
+import json
+import mmap
+import re
+
+from array import array
+from functools import lru_cache
+from json.decoder import scanstring
+
+from harfields import BODY_FIELDS
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# the start of the string holding the text of a postData or content object
+BODY_KEY = re.compile(r'"text"\s*:\s*"')
+
+
+class BodyText(str):
+    """A body read from a HAR file which knows the byte offsets of its JSON string in
+    the file, so it can be read from the file again instead of being kept in memory."""
+    span = None
+
+
+def _utf8Length(text):
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+def markBodies(entry, text, first, last, offset):
+    """Replace the bodies of an entry decoded from text[first:last], which starts at
+    byte offset in the file, with BodyTexts."""
+    holders = []
+    for holder in BODY_FIELDS.values():
+        try:
+            body_holder = holder(entry)
+        except AttributeError:
+            # not an object, the entry is rejected on import anyway
+            continue
+        if isinstance(body_holder, dict) and isinstance(body_holder.get('text'), str) \
+                and body_holder['text']:
+            holders.append(body_holder)
+
+    for match in BODY_KEY.finditer(text, first, last):
+        if not holders:
+            break
+        try:
+            value, end = scanstring(text, match.end())
+        except ValueError:
+            continue
+        # any string which decodes to the same body will do
+        for body_holder in [h for h in holders if h['text'] == value]:
+            body = BodyText(value)
+            body.span = (offset + _utf8Length(text[first:match.end() - 1]),
+                         offset + _utf8Length(text[first:end]))
+            body_holder['text'] = body
+            holders.remove(body_holder)
+
+
+class HarReader(object):
+    """Incrementally read a HAR file, yielding the members of log.entries one at a
+    time instead of loading the whole document into memory with json.load.
+
+    Everything in the log object other than the entries (version, creator, browser,
+    pages...) is collected into self.log as it is encountered. The byte offsets of the
+    start and end of each entry in the file are collected into self.offsets, and the
+    bodies of each entry are BodyTexts.
+    """
+
+    def __init__(self, path, chunk_size=1 << 20):
+        self.path = path
+        self.log = {}
+        self.entry_count = 0
+        self.bytes_read = 0
+        self.offsets = array('Q')
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+        self._file = None
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        # byte offset in the file of the start of the buffer, and of self._buffer[self._mark]
+        # relative to it
+        self._base = 0
+        self._mark = 0
+        self._mark_bytes = 0
+
+    def entries(self):
+        """Generator yielding each raw entry dictionary in file order. Raises
+        json.JSONDecodeError if the file isn't a JSON object, or UnicodeDecodeError if
+        it isn't UTF-8 encoded."""
+        self._file = open(self.path, 'rb')
+        try:
+            self._expect('{')
+            if self._peek() == '}':
+                return
+            while True:
+                key = self._readKey()
+                if key == 'log':
+                    yield from self._readLog()
+                else:
+                    self._readValue()
+                if self._separator('}'):
+                    return
+        finally:
+            self._file.close()
+
+    def _readLog(self):
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._readKey()
+            if key == 'entries' and self._peek() == '[':
+                self._pos += 1
+                if self._peek() == ']':
+                    self._pos += 1
+                else:
+                    while True:
+                        self._peek()
+                        start = self.tell()
+                        entry = self._readValue()
+                        # self._mark is still at the start of the entry
+                        markBodies(entry, self._buffer, self._mark, self._pos, start)
+                        self.offsets.extend((start, self.tell()))
+                        self.entry_count += 1
+                        yield entry
+                        if self._separator(']'):
+                            break
+            else:
+                self.log[key] = self._readValue()
+            if self._separator('}'):
+                return
+
+    def _fill(self, size=None):
+        """Read another chunk from the file, discarding the consumed part of the
+        buffer. Returns False once the end of the file has been reached."""
+        while not self._eof:
+            chunk = self._file.read(size or self._chunk_size)
+            if not self.bytes_read and chunk.startswith(codecs.BOM_UTF8):
+                # the decoder drops the byte order mark
+                self._base = len(codecs.BOM_UTF8)
+            self.bytes_read += len(chunk)
+            self._eof = not chunk
+            text = self._utf8.decode(chunk, final=self._eof)
+            # a chunk may end part way through a multi-byte character
+            if text:
+                self._base = self.tell()
+                self._mark = self._mark_bytes = 0
+                self._buffer = self._buffer[self._pos:] + text
+                self._pos = 0
+                return True
+        return False
+
+    def tell(self):
+        """Byte offset in the file of the next character to be read."""
+        if self._pos != self._mark:
+            consumed = self._buffer[self._mark:self._pos]
+            self._mark_bytes += len(consumed) if consumed.isascii() else len(consumed.encode('utf-8'))
+            self._mark = self._pos
+        return self._base + self._mark_bytes
+
+    def _peek(self):
+        """Return the next non-whitespace character without consuming it."""
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise json.JSONDecodeError('Expecting {!r}'.format(char), self._buffer, self._pos)
+        self._pos += 1
+
+    def _separator(self, closing):
+        """Consume a ',' or the closing bracket of the current container. Returns
+        True if the container has been closed."""
+        char = self._peek()
+        if char == ',':
+            self._pos += 1
+            return False
+        if char == closing:
+            self._pos += 1
+            return True
+        raise json.JSONDecodeError('Expecting \',\' delimiter', self._buffer, self._pos)
+
+    def _readKey(self):
+        if self._peek() != '"':
+            raise json.JSONDecodeError('Expecting property name enclosed in double quotes',
+                                       self._buffer, self._pos)
+        key = self._readValue()
+        self._expect(':')
+        return key
+
+    def _readValue(self):
+        """Decode the next complete JSON value from the buffer, reading more of the
+        file as required. The read size grows with the buffer so that very large
+        values (e.g. multi-megabyte bodies) are decoded in linear time."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill(max(self._chunk_size, len(self._buffer))):
+                    raise
+                continue
+            # a number running up to the end of the buffer may be incomplete
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+
+class HarEntries(object):
+    """The entries of a HAR file read one at a time, on demand, from the byte offsets
+    collected by a HarReader. The file is memory mapped and only the entries which are
+    looked at are parsed. A few recently parsed entries are kept, as the fields of an
+    entry tend to be looked at together.
+    """
+
+    def __init__(self, path, offsets):
+        self.path = path
+        self.offsets = offsets
+        with open(path, 'rb') as har_file:
+            self.data = mmap.mmap(har_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._parse = lru_cache(maxsize=64)(self._parseEntry)
+
+    def __len__(self):
+        return len(self.offsets) // 2
+
+    def __getitem__(self, k):
+        if not 0 <= k < len(self):
+            raise IndexError(k)
+        return self._parse(k)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+    def _parseEntry(self, k):
+        start, end = self.offsets[2 * k], self.offsets[2 * k + 1]
+        text = self.data[start:end].decode('utf-8')
+        entry = json.loads(text)
+        markBodies(entry, text, 0, len(text), start)
+        return entry
+
+    def close(self):
+        self.data.close()
@@ -11,12 +11,15 @@ Usage:
 """
 
 import itertools
+import multiprocessing
 import os
 import sys
-from itertools import cycle
+
+from concurrent.futures import ProcessPoolExecutor
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtCore import QSize
+from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QIcon
 from PyQt5.QtGui import QTextOption
 from PyQt5.QtGui import QFontDatabase
@@ -25,47 +28,64 @@ from PyQt5.QtWidgets import QAction
 from PyQt5.QtWidgets import qApp
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtWidgets import QGroupBox
+from PyQt5.QtWidgets import QHeaderView
 from PyQt5.QtWidgets import QMainWindow
 from PyQt5.QtWidgets import QLineEdit
 from PyQt5.QtWidgets import QPlainTextEdit
+from PyQt5.QtWidgets import QProgressBar
 from PyQt5.QtWidgets import QPushButton
 from PyQt5.QtWidgets import QShortcut
 from PyQt5.QtWidgets import QSplitter
+from PyQt5.QtWidgets import QTableView
 from PyQt5.QtWidgets import QTabWidget
-from PyQt5.QtWidgets import QTableWidget
-from PyQt5.QtWidgets import QTableWidgetItem
 from PyQt5.QtWidgets import QTextEdit
 from PyQt5.QtWidgets import QHBoxLayout
 from PyQt5.QtWidgets import QVBoxLayout
 from PyQt5.QtWidgets import QWidget
 
 import configmgr
+from sizedcache import SizedCache
+from bodyviewer import BodyViewer
+from entriesmodel import EntriesModel
 from actions.aboutdialog import AboutDialog
 from actions.columnselectdialog import ColumnSelectDialog
 from actions.entryselector import EntrySelector
 from actions.fileimporter import FileImporter
 from actions.globalsearch import GlobalSearch
+from actions.globalsearch import IndexWorker
+from actions.prettyprinter import PrettyPrinter
 from harshark_exceptions import HarImportException
+from harshark_exceptions import SearchQueryException
+from searchquery import compileQuery
 from actions.subsearch import SubSearch
 from actions.generic import clearEntriesSearch
 from actions.generic import clearTabSearch
 from actions.generic import colourizeCells
 from actions.generic import decolourizeCells
-from actions.generic import expandBody
 from actions.generic import resizeColumns
 
 
 class MainApp(QMainWindow):
 
+    # characters of rendered HTML to keep for the headers and cookies tabs
+    RENDER_CACHE_SIZE = 1 << 22
+
     def __init__(self):
         super().__init__()
         self.version = '2.3.1'
         self.config = configmgr.ConfigMgr()
         self.har_summary = None
-        self.har_parsed = None
+        self.entry_store = None
+        self.importer = None
+        self.index_worker = None
+        self.search_pool = None
+        self.global_search = None
         self.global_results = None
-        self.request_results = None
-        self.response_results = None
+        self.entry_selector = None
+        self.render_cache = SizedCache(self.RENDER_CACHE_SIZE)
+        self.request_search = None
+        self.response_search = None
+        self.pretty_printer = PrettyPrinter(self)
         self.buildUi()
 
     def buildUi(self):
@@ -108,6 +128,7 @@ class MainApp(QMainWindow):
         sort_icon = QIcon(os.path.join(icon_path, 'sort-alpha-down.svg'))
         colour_icon = QIcon(os.path.join(icon_path, 'paint-brush.svg'))
         saml_icon = QIcon(os.path.join(icon_path, 'address-card.svg'))
+        filter_icon = QIcon(os.path.join(icon_path, 'crosshairs.svg'))
         self.about_icon = QIcon(os.path.join(icon_path, 'question-circle.svg'))
         self.column_select_icon = QIcon(os.path.join(icon_path, 'columns.svg'))
 
@@ -125,10 +146,10 @@ class MainApp(QMainWindow):
         # ------------
 
         # open file
-        action_open = QAction('&Open', self, shortcut='Ctrl+O', icon=open_icon,
-                              statusTip='Open a new HAR file')
-        action_open.triggered.connect(self.openFile)
-        menubar_file.addAction(action_open)
+        self.action_open = QAction('&Open', self, shortcut='Ctrl+O', icon=open_icon,
+                                   statusTip='Open a new HAR file')
+        self.action_open.triggered.connect(self.openFile)
+        menubar_file.addAction(self.action_open)
 
         # quit Harshark
         action_exit = QAction('&Exit', self, shortcut='Ctrl+Q', icon=quit_icon,
@@ -162,6 +183,17 @@ class MainApp(QMainWindow):
         self.action_sort.triggered.connect(self.toggleSort)
         menubar_view.addAction(self.action_sort)
 
+        # pretty print JSON, XML and HTML bodies
+        self.action_pretty = QAction('&Pretty Print Bodies', self, shortcut='ALT+P', icon=wrap_icon,
+                                     checkable=True, statusTip=('Format JSON, XML and HTML '
+                                     'request and response bodies for reading'))
+
+        if self.config.getConfig('pretty-print'):
+            self.action_pretty.setChecked(True)
+
+        self.action_pretty.triggered.connect(self.togglePrettyPrint)
+        menubar_view.addAction(self.action_pretty)
+
         # cell colourizations
         self.action_colourization = QAction('&Cell Colourization', self, shortcut='ALT+C',
                                             icon=colour_icon, checkable=True, 
@@ -225,7 +257,7 @@ class MainApp(QMainWindow):
         toolbar_search.setIconSize(QSize(18, 18))
 
         # open file
-        toolbar_main.addAction(action_open)
+        toolbar_main.addAction(self.action_open)
 
         # case-sensitive searching
         self.toggle_case = QAction('Case sensitive searching', self, checkable=True,
@@ -237,6 +269,16 @@ class MainApp(QMainWindow):
         self.toggle_case.triggered.connect(self.toggleCase)
         toolbar_search.addAction(self.toggle_case)
 
+        # show only matching entries rather than highlighting them
+        self.toggle_filter = QAction('Filter search results', self, checkable=True,
+                                     icon=filter_icon, toolTip='Toggle hiding entries which don\'t match the search')
+
+        if self.config.getConfig('filter-search-results'):
+            self.toggle_filter.setChecked(True)
+
+        self.toggle_filter.triggered.connect(self.toggleFilter)
+        toolbar_search.addAction(self.toggle_filter)
+
         # global search
         self.global_searchbox = QLineEdit(self, placeholderText='Enter a search query...',
                                           readOnly=True, clearButtonEnabled=True)
@@ -244,6 +286,13 @@ class MainApp(QMainWindow):
         self.global_searchbox.setMinimumHeight(30)
         self.global_searchbox.setContentsMargins(5, 0, 5, 0)
         self.global_searchbox.returnPressed.connect(self.globalSearch)
+
+        # search as the user types, once they pause
+        self.live_search_timer = QTimer(self, singleShot=True,
+                                        interval=self.config.getConfig('live-search-delay'))
+        self.live_search_timer.timeout.connect(lambda: self.globalSearch(live=True))
+        if self.config.getConfig('live-search'):
+            self.global_searchbox.textEdited.connect(self.liveSearch)
         toolbar_search.addWidget(self.global_searchbox)
 
         # global search: next match
@@ -263,17 +312,36 @@ class MainApp(QMainWindow):
         # ---------------------------------------------------------
         self.statusbar = self.statusBar()
 
+        # import progress
+        self.import_progress = QProgressBar(maximum=1000, textVisible=False)
+        self.import_progress.setMaximumWidth(200)
+        self.import_progress.hide()
+        self.statusbar.addPermanentWidget(self.import_progress)
+
+        # cancel import
+        self.import_cancel_btn = QPushButton('Cancel', toolTip='Cancel the import and keep the '
+                                             'current HAR file loaded')
+        self.import_cancel_btn.clicked.connect(self.cancelImport)
+        self.import_cancel_btn.hide()
+        self.statusbar.addPermanentWidget(self.import_cancel_btn)
+
         # ---------------------------------------------------------
         # ENTRIES TABLE
         # ---------------------------------------------------------
-        self.entries_table = QTableWidget()
-        self.entries_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.entries_model = EntriesModel(self.config)
+        self.entries_table = QTableView()
+        self.entries_table.setModel(self.entries_model)
+        self.entries_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.entries_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.entries_table.setHorizontalScrollMode(QAbstractItemView.ScrollPerPixel)
         self.entries_table.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
 
+        # fixed row heights so that rows never need to be measured
+        self.entries_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.entries_table.verticalHeader().setDefaultSectionSize(22)
+
         # select an entry
-        self.entries_table.itemSelectionChanged.connect(self.entrySelect)
+        self.entries_table.selectionModel().currentRowChanged.connect(self.entrySelect)
 
         # ---------------------------------------------------------
         # REQUEST TABS
@@ -301,7 +369,8 @@ class MainApp(QMainWindow):
         self.request_headers_tab_text = QTextEdit(readOnly=True)
         self.request_query_tab_text = QTextEdit(readOnly=True)
         self.request_cookie_tab_text = QTextEdit(readOnly=True)
-        self.request_body_tab_text = QPlainTextEdit(readOnly=True)
+        body_page_size = self.config.getConfig('body-page-size')
+        self.request_body_tab_text = BodyViewer(body_page_size)
         self.request_saml_tab_text = QPlainTextEdit(readOnly=True)
 
         # ROBUSTNESS :: We index into this list from a few areas so UI order must be
@@ -323,16 +392,10 @@ class MainApp(QMainWindow):
         request_cookie_tab_layout = QVBoxLayout()
         request_saml_tab_layout = QVBoxLayout()
 
-        truncate_length = self.config.getConfig('truncate-character-count')
-        truncate_button_text = ('Content truncated to {} characters. '
-                                'Click to show all content.').format(truncate_length)
-        self.request_expand_button = QPushButton(truncate_button_text)
-        self.request_expand_button.hide()
-
         request_headers_tab_layout.addWidget(self.request_headers_tab_text)
         request_headers_tab.setLayout(request_headers_tab_layout)
 
-        self.request_body_tab_layout.addWidget(self.request_expand_button)
+        self.request_body_tab_layout.addWidget(self.request_body_tab_text.navigator)
         self.request_body_tab_layout.addWidget(self.request_body_tab_text)
         request_body_tab.setLayout(self.request_body_tab_layout)
 
@@ -345,9 +408,6 @@ class MainApp(QMainWindow):
         request_saml_tab_layout.addWidget(self.request_saml_tab_text)
         request_saml_tab.setLayout(request_saml_tab_layout)
 
-        # un-truncate request body
-        self.request_expand_button.clicked.connect(lambda: expandBody(self, 'request'))
-
         # clear search highlights on tab change
         self.request_tabs.currentChanged.connect(lambda: self.tabChanged('request'))
 
@@ -380,7 +440,7 @@ class MainApp(QMainWindow):
 
         self.response_headers_tab_text = QTextEdit(readOnly=True)
         self.response_cookie_tab_text = QTextEdit(readOnly=True)
-        self.response_body_tab_text = QPlainTextEdit(readOnly=True)
+        self.response_body_tab_text = BodyViewer(body_page_size)
 
         # ROBUSTNESS :: We index into this list from a few areas so UI order must be
         # preserved. Can this be made less fragile?
@@ -396,22 +456,16 @@ class MainApp(QMainWindow):
         self.response_body_tab_layout = QVBoxLayout()
         response_cookie_tab_layout = QVBoxLayout()
 
-        self.response_expand_button = QPushButton(truncate_button_text)
-        self.response_expand_button.hide()
-
         response_headers_tab_layout.addWidget(self.response_headers_tab_text)
         response_headers_tab.setLayout(response_headers_tab_layout)
 
-        self.response_body_tab_layout.addWidget(self.response_expand_button)
+        self.response_body_tab_layout.addWidget(self.response_body_tab_text.navigator)
         self.response_body_tab_layout.addWidget(self.response_body_tab_text)
         response_body_tab.setLayout(self.response_body_tab_layout)
 
         response_cookie_tab_layout.addWidget(self.response_cookie_tab_text)
         response_cookie_tab.setLayout(response_cookie_tab_layout)
 
-        # un-truncate response body
-        self.response_expand_button.clicked.connect(lambda: expandBody(self, 'response'))
-
         # clear search highlights on tab change
         self.response_tabs.currentChanged.connect(lambda: self.tabChanged('response'))
 
@@ -493,21 +547,91 @@ class MainApp(QMainWindow):
 
     def openFile(self):
         try:
-            FileImporter(self)
+            self.importer = FileImporter(self)
         except HarImportException:
             return()
 
+    def cancelImport(self, wait=False):
+        if self.importer:
+            self.importer.cancel(wait=wait)
+
+    def startIndexing(self):
+        """Build the global search index for the current HAR file in the background."""
+        self.stopIndexing()
+        if self.entry_store is not None:
+            index_size = self.config.getConfig('search-index-size') << 20
+            self.index_worker = IndexWorker(self.entry_store,
+                                            use_index=self.config.getConfig('search-index'),
+                                            index_size=index_size)
+            self.index_worker.start()
+
+    def stopIndexing(self):
+        # searches use the index and haystacks, whether or not they are still being built
+        self.cancelGlobalSearch()
+        # the worker checks for interruption between entries so this doesn't block for long
+        if self.index_worker:
+            self.index_worker.requestInterruption()
+            self.index_worker.wait()
+            self.index_worker.haystacks.close()
+            self.index_worker = None
+
+    def searchPool(self):
+        """Process pool for searching large HAR files, or None if searches should only
+        use this process."""
+        processes = self.config.getConfig('search-processes') or os.cpu_count() or 1
+        if processes < 2:
+            return None
+        if self.search_pool is None:
+            # forking a process running Qt threads isn't safe
+            self.search_pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'))
+        return self.search_pool
+
+    def stopSearchPool(self):
+        # shards still queued are cancelled along with the search which submitted them
+        # (see stopIndexing), so worker processes aren't kept busy after this
+        if self.search_pool:
+            self.search_pool.shutdown(wait=False)
+            self.search_pool = None
+
+    def searchIndex(self):
+        """The (possibly partial) search index and haystacks of the current HAR file."""
+        if self.index_worker and self.index_worker.entry_store is self.entry_store:
+            return self.index_worker.index, self.index_worker.haystacks
+        return None, None
+
     def columnSelector(self):
         ColumnSelectDialog(self)
 
     def entrySelect(self):
-        if self.entries_table.currentRow() > -1:
+        if self.entries_table.currentIndex().row() > -1:
             EntrySelector(self)
 
     def toggleCase(self):
         current = self.config.getConfig('case-sensitive-matching')
         self.config.setConfig('case-sensitive-matching', not current)
 
+    def toggleFilter(self):
+        current = self.config.getConfig('filter-search-results')
+        self.config.setConfig('filter-search-results', not current)
+
+        # apply to the current search results, once they are all in
+        if not self.global_results or (self.global_search and self.global_search.searching()):
+            return
+
+        current_index = self.entries_table.currentIndex()
+        selected = self.entries_model.entryId(current_index.row()) if current_index.isValid() else None
+
+        if current:
+            self.entries_model.clearFilter()
+        else:
+            self.entries_model.setFilter(self.global_results)
+
+        # the filter resets the table, keep the same entry selected if it is still shown
+        if selected is not None and self.entries_model.rowOfEntry(selected) > -1:
+            self.entries_table.selectRow(self.entries_model.rowOfEntry(selected))
+        else:
+            self.nextMatchGlobal()
+
     def toggleWrap(self):
         current = self.config.getConfig('word-wrap')
         self.config.setConfig('word-wrap', not current)
@@ -523,6 +647,12 @@ class MainApp(QMainWindow):
     def toggleSort(self):
         current = self.config.getConfig('sort-headers')
         self.config.setConfig('sort-headers', not current)
+        self.render_cache.clear()
+        self.entrySelect()
+
+    def togglePrettyPrint(self):
+        current = self.config.getConfig('pretty-print')
+        self.config.setConfig('pretty-print', not current)
         self.entrySelect()
 
     def toggleColourization(self):
@@ -539,36 +669,73 @@ class MainApp(QMainWindow):
         if not current:
             self.statusbar.showMessage('SAML parsing has been enabled. Please re-open the HAR file.')
 
-    def globalSearch(self):
-        search_results = GlobalSearch(self).found_rows
-        if search_results:
-            # move the first match to the end of the list so that the next row selected is 
-            # actually the next row and not the current row.
-            search_results.append(search_results.pop(0))
-            self.global_results = cycle(search_results)
+    def liveSearch(self):
+        # typing again stops the search for what was typed before
+        if self.global_search and self.global_search.searching():
+            self.cancelGlobalSearch()
+        self.live_search_timer.start()
+
+    def globalSearch(self, live=False):
+        self.live_search_timer.stop()
+        search_string = self.global_searchbox.text()
+        case_sensitive = self.config.getConfig('case-sensitive-matching')
+
+        # field terms are often only half typed during a live search
+        try:
+            query = compileQuery(search_string, case_sensitive)
+        except SearchQueryException as e:
+            self.cancelGlobalSearch()
+            self.global_results = None
+            clearEntriesSearch(self)
+            self.statusbar.showMessage('[ERROR] Invalid search query, {}.'.format(e))
+            return
+
+        # if the query only got longer, only the previous matches can still match
+        within = None
+        if self.global_search and self.global_search.narrows(search_string, query, case_sensitive):
+            within = self.global_search.found_ids
+
+        self.cancelGlobalSearch()
+        # results of an asynchronous search are added to found_ids as they come in
+        self.global_search = GlobalSearch(self, query, within=within, live=live)
+        self.global_results = self.global_search.found_ids
+
+    def cancelGlobalSearch(self):
+        if self.global_search:
+            self.global_search.cancel()
+            self.global_search = None
 
     def nextMatchGlobal(self):
-        next_row = next(self.global_results)
+        """Select the first match below the current row, wrapping around to the top. Matches
+        are held as entry IDs so this still works after the table is re-sorted."""
+        if not self.global_results:
+            return
+        current_row = self.entries_table.currentIndex().row()
+        # matches may be hidden by a filter
+        match_rows = [row for row in map(self.entries_model.rowOfEntry, self.global_results) if row > -1]
+        if not match_rows:
+            return
+        next_row = min((row for row in match_rows if row > current_row), default=min(match_rows))
         self.entries_table.selectRow(next_row)
         self.entries_table.setFocus()
 
     def clearMatchGlobal(self):
+        self.cancelGlobalSearch()
         clearEntriesSearch(self)
         self.global_searchbox.setText('')
 
     def tabChanged(self, tab_group):
         clearTabSearch(self, tab_group=tab_group)
+        # tabs are only filled in for the selected entry once they are looked at
+        if self.entry_selector:
+            tabs = self.request_tabs if tab_group == 'request' else self.response_tabs
+            self.entry_selector.populateTab(tab_group, tabs.currentIndex())
 
     def subSearch(self, tab_group):
-        search_results = SubSearch(self, tab_group).matches
-        if search_results:
-            # move the first match to the end of the list so that the next row selected is 
-            # actually the next row and not the current row.
-            search_results.append(search_results.pop(0))
-            if tab_group == 'request':
-                self.request_results = cycle(search_results)
-            elif tab_group == 'response':
-                self.response_results = cycle(search_results)
+        if tab_group == 'request':
+            self.request_search = SubSearch(self, tab_group)
+        elif tab_group == 'response':
+            self.response_search = SubSearch(self, tab_group)
 
     def clearMatchSub(self, tab_group):
         clearTabSearch(self, tab_group=tab_group)
@@ -579,16 +746,9 @@ class MainApp(QMainWindow):
 
     def nextMatchSub(self, tab_group):
         if tab_group == 'request':
-            next_match = next(self.request_results)
-            active_tab_index = self.request_tabs.currentIndex()
-            active_tab_textedit = self.request_textedits[active_tab_index]
+            self.request_search.nextMatch()
         elif tab_group == 'response':
-            next_match = next(self.response_results)
-            active_tab_index = self.response_tabs.currentIndex()
-            active_tab_textedit = self.response_textedits[active_tab_index]
-
-        active_tab_textedit.setTextCursor(next_match)
-        active_tab_textedit.setFocus()
+            self.response_search.nextMatch()
 
     def aboutDialog(self):
         AboutDialog(self)
@@ -596,6 +756,10 @@ class MainApp(QMainWindow):
 def main():
     app = QApplication(sys.argv)
     main_harshark = MainApp()
+    # don't leave an import or indexing thread running on exit
+    app.aboutToQuit.connect(lambda: main_harshark.cancelImport(wait=True))
+    app.aboutToQuit.connect(lambda: main_harshark.stopIndexing())
+    app.aboutToQuit.connect(lambda: main_harshark.stopSearchPool())
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
@@ -1,2 +1,5 @@
 class HarImportException(BaseException):
     pass
+
+class SearchQueryException(BaseException):
+    pass
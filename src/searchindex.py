@@ -0,0 +1,263 @@
+import mmap
+import os
+import tempfile
+
+from array import array
+from bisect import bisect_right
+
+from harfields import BODY_FIELDS
+
+# entry text is a repr of a list so never contains a raw NUL
+SEPARATOR = b'\x00'
+
+
+def valuesFromDict(d):
+    """Yield every non-empty value in a (nested) entry dictionary."""
+    for v in d.values():
+        if v:
+            if isinstance(v, list):
+                for i in v:
+                    if isinstance(i, dict):
+                        yield from valuesFromDict(i)
+                    else:
+                        if i: yield i
+            elif isinstance(v, dict):
+                yield from valuesFromDict(v)
+            else:
+                yield v
+
+def searchText(entry):
+    """The text global search matches against for an entry dictionary."""
+    return str(list(valuesFromDict(entry)))
+
+def entryText(entry_store, k):
+    """The text global search matches against for entry k of an EntryStore."""
+    return searchText(entry_store.entry(k, memoise=False))
+
+def indexText(entry, body_prefix):
+    """The search text of an entry with its bodies cut down to their first body_prefix
+    characters, and whether any body was cut short."""
+    truncated = False
+    for field in BODY_FIELDS:
+        body = entry.get(field)
+        if body and len(body) > body_prefix:
+            entry = dict(entry)
+            entry[field] = body[:body_prefix]
+            truncated = True
+    return searchText(entry), truncated
+
+def trigrams(text):
+    return set(map(''.join, zip(text, text[1:], text[2:])))
+
+
+def _findEntries(data, starts, end, search_bytes):
+    """Positions in starts of the entries within data[starts[0]:end] which contain
+    search_bytes. Each entry is only reported once however often it matches."""
+    found = []
+    pos = data.find(search_bytes, starts[0], end)
+    while pos != -1:
+        i = bisect_right(starts, pos) - 1
+        found.append(i)
+        # carry on from the start of the next entry
+        if i + 1 == len(starts):
+            break
+        pos = data.find(search_bytes, starts[i + 1], end)
+    return found
+
+def searchShardFile(path, starts, end, search_bytes):
+    """Search a shard written by another process, for use in a process pool."""
+    with open(path, 'rb') as shard_file:
+        with mmap.mmap(shard_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _findEntries(data, starts, end, search_bytes)
+
+
+class Shard(object):
+    """The casefolded, UTF-8 encoded search text of a run of consecutive entries,
+    written to a temporary file and memory mapped. Other processes can map the same
+    file, so searches can be spread over several cores without copying the text to each
+    of them. The file is on disk, so the page cache can drop what isn't being searched."""
+
+    def __init__(self, first, foldeds):
+        self.first = first
+        self.size = len(foldeds)
+        self.starts = array('Q')
+        offset = 0
+        for folded in foldeds:
+            self.starts.append(offset)
+            offset += len(folded) + 1
+        self.end = offset - 1
+
+        fd, self.path = tempfile.mkstemp(prefix='harshark-', suffix='.shard')
+        with os.fdopen(fd, 'wb') as shard_file:
+            shard_file.write(SEPARATOR.join(foldeds))
+        with open(self.path, 'rb') as shard_file:
+            self.data = mmap.mmap(shard_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def search(self, search_bytes):
+        return [self.first + i for i in _findEntries(self.data, self.starts, self.end, search_bytes)]
+
+    def contains(self, k, search_bytes):
+        i = k - self.first
+        end = self.end
+        if i + 1 < len(self.starts):
+            end = self.starts[i + 1] - 1
+        return self.data.find(search_bytes, self.starts[i], end) != -1
+
+    def close(self):
+        self.data.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            # another process may still have the file open on Windows
+            pass
+
+
+class Haystacks(object):
+    """The casefolded search text of every entry, flattened once so that searching is
+    nothing but substring matching. Only the casefolded text is kept: anything found in
+    it is a candidate for a case-sensitive search, which is then confirmed against the
+    entry itself.
+
+    Entries are collected into Shards. Entries are added in order and only the first
+    self.count entries, those in complete shards, are searchable.
+    """
+
+    # approximate number of characters in each shard
+    SHARD_SIZE = 1 << 22
+
+    def __init__(self):
+        self.count = 0
+        # bytes in all of the shards
+        self.size = 0
+        self.shards = []
+        self._firsts = []
+        self._pending = []
+        self._pending_size = 0
+
+    def add(self, folded):
+        self._pending.append(folded)
+        self._pending_size += len(folded)
+        if self._pending_size >= self.SHARD_SIZE:
+            self.finish()
+
+    def finish(self):
+        """Make any entries added since the last complete shard searchable."""
+        if not self._pending:
+            return
+
+        shard = Shard(self.count, [folded.encode('utf-8') for folded in self._pending])
+
+        self._firsts.append(self.count)
+        self.shards.append(shard)
+        self.size += shard.end
+        self.count += len(self._pending)
+        self._pending = []
+        self._pending_size = 0
+
+    def searchBytes(self, search_string):
+        """The search string as it appears in the shards."""
+        return search_string.casefold().encode('utf-8')
+
+    def searchable(self, count):
+        """Shards holding the first count (no more than self.count) entries."""
+        return [shard for shard in self.shards if shard.first < count]
+
+    def search(self, search_bytes, count):
+        """Yield, in file order, each of the first count (no more than self.count)
+        entries whose casefolded text contains the search bytes."""
+        for shard in self.searchable(count):
+            yield from shard.search(search_bytes)
+
+    def contains(self, k, search_bytes):
+        """Whether the casefolded text of entry k, one of the first self.count, contains
+        the search bytes."""
+        shard = self.shards[bisect_right(self._firsts, k) - 1]
+        return shard.contains(k, search_bytes)
+
+    def close(self):
+        """Remove the shard files. Pending entries are discarded."""
+        self._pending = []
+        for shard in self.shards:
+            shard.close()
+        self.shards = []
+        self._firsts = []
+        self.count = 0
+
+
+class SearchIndex(object):
+    """Trigram inverted index over the casefolded text of each entry.
+
+    Any entry containing a search string must contain every trigram of it, so the
+    postings of the query's trigrams narrow the search down to a few candidate
+    entries, which then only need to be checked for the full string.
+
+    Only bounded text is indexed: entries whose bodies were cut short (see indexText)
+    or with more text than MAX_TEXT aren't indexed and are always a candidate. The
+    index keeps a rough count of the memory it takes so it can be given up on past a
+    budget, see full().
+
+    Entries are added in order and only the first self.count entries are searchable,
+    so the index can be used while it is still being built.
+    """
+
+    # characters of each body which are indexed
+    BODY_PREFIX = 1 << 10
+    MAX_TEXT = 1 << 16
+    # rough bytes taken by each distinct trigram (the key, its dict slot and array)
+    TRIGRAM_SIZE = 160
+
+    def __init__(self, max_size=None):
+        self.count = 0
+        # rough bytes taken by the postings
+        self.size = 0
+        self.max_size = max_size
+        self.postings = {}
+        self.unindexed = array('I')
+
+    def full(self):
+        """Whether the index has grown past its memory budget."""
+        return self.max_size is not None and self.size > self.max_size
+
+    def add(self, k, folded, complete=True):
+        """Index the casefolded search text of entry k, complete unless some of the
+        text was left out."""
+        if not complete or len(folded) > self.MAX_TEXT:
+            self.unindexed.append(k)
+        else:
+            postings = self.postings
+            entry_trigrams = trigrams(folded)
+            for trigram in entry_trigrams:
+                entries = postings.get(trigram)
+                if entries is None:
+                    entries = postings[trigram] = array('I')
+                    self.size += self.TRIGRAM_SIZE
+                entries.append(k)
+            self.size += 4 * len(entry_trigrams)
+        self.count = k + 1
+
+    def candidates(self, search_string, count):
+        """Entries amongst the first count (no more than self.count) which may contain
+        the search string, in file order. Returns None if the string is too short to
+        use the index."""
+        search_trigrams = trigrams(search_string.casefold())
+        if not search_trigrams:
+            return None
+
+        postings = []
+        for trigram in search_trigrams:
+            entries = self.postings.get(trigram)
+            if entries is None:
+                postings = []
+                break
+            postings.append(entries)
+
+        found = set()
+        if postings:
+            postings.sort(key=len)
+            found = set(postings[0])
+            for entries in postings[1:]:
+                found.intersection_update(entries)
+                if not found:
+                    break
+        found.update(self.unindexed)
+        return sorted(k for k in found if k < count)
@@ -0,0 +1,233 @@
+"""Field-scoped global search queries.
+
+A query is a list of space separated terms which all have to match:
+
+    status:>=500 host:api.* method:POST time:>2000 body~"error" -mime:image
+
+field:value matches a field. Numeric fields take a number optionally preceded by one of
+>, >=, <, <=, = or !=. Other fields match if the value appears anywhere in the field or,
+if the value contains * or ? wildcards, if the whole field matches the pattern.
+field~regex matches a regular expression anywhere in a field. decoded: matches response
+content after decoding it from its content.encoding (e.g. base64). A leading - negates a
+term. Values may be quoted to include spaces. Any other term is searched for anywhere
+in the entry, as a plain global search would.
+
+Each term is compiled once into a check of a single entry against the columns of an
+EntryStore, so that a search can check entries a slice at a time between UI events.
+Terms are checked cheapest first, and an entry is dropped at the first one it fails.
+"""
+
+import fnmatch
+import operator
+import re
+import shlex
+
+from contentdecoder import decodeContent
+from entrystore import NUMERIC_FIELDS
+from entrystore import OBJECT_FIELDS
+from entrystore import StringColumn
+from harfields import EXTRACTORS
+from harshark_exceptions import SearchQueryException
+
+# response content decoded from its content.encoding, not a field of the store as it is
+# only decoded when a query asks for it
+DECODED_CONTENT = 'response_content_decoded'
+
+# short names for commonly searched fields, any field name can also be used as is
+FIELD_ALIASES = {
+    'status': ('response_status',),
+    'reason': ('response_statusText',),
+    'method': ('request_method',),
+    'host': ('request_hostname',),
+    'port': ('request_port',),
+    'protocol': ('request_protocol',),
+    'path': ('request_path',),
+    'url': ('request_url',),
+    'ip': ('serverIPAddress',),
+    'mime': ('response_content_mimeType',),
+    'redirect': ('response_redirectURL',),
+    'body': ('request_postData_text', 'response_content_text'),
+    'decoded': (DECODED_CONTENT,),
+    'header': ('request_headers', 'response_headers'),
+    'cookie': ('request_cookies', 'response_cookies'),
+    'param': ('request_queryString', 'request_postData_params'),
+    'time': ('time',),
+    'size': ('response_content_size',),
+    'blocked': ('timings_blocked',),
+    'dns': ('timings_dns',),
+    'connect': ('timings_connect',),
+    'ssl': ('timings_ssl',),
+    'send': ('timings_send',),
+    'wait': ('timings_wait',),
+    'receive': ('timings_receive',),
+}
+
+COMPARISONS = [
+    ('>=', operator.ge),
+    ('<=', operator.le),
+    ('!=', operator.ne),
+    ('>', operator.gt),
+    ('<', operator.lt),
+    ('=', operator.eq),
+]
+
+TERM = re.compile(r'^(-?)([A-Za-z_]+)([:~])(.*)$', re.DOTALL)
+
+
+def _fields(name):
+    if name in FIELD_ALIASES:
+        return FIELD_ALIASES[name]
+    if name in EXTRACTORS:
+        return (name,)
+    return None
+
+def _decodedText(entry_store, k):
+    decoded = decodeContent(entry_store.value(k, 'response_content_text'),
+                            entry_store.value(k, 'response_content_encoding'),
+                            entry_store.value(k, 'response_content_mimeType'),
+                            (k, 'response_content_text'))
+    # binary content is only shown as a hex dump, there is no text to match
+    return '' if decoded.binary else decoded.text
+
+def _objectText(item):
+    # cookies constructed from headers are plain strings
+    if isinstance(item, dict):
+        return '{}: {}'.format(item.get('name'), item.get('value'))
+    return str(item)
+
+
+class FieldTerm(object):
+    """A single field:value or field~regex term of a query."""
+
+    def __init__(self, fields, operation, value, negate, case_sensitive):
+        self.fields = fields
+        self.negate = negate
+        self.numeric = all(field in NUMERIC_FIELDS for field in fields)
+        self.match = self._compile(operation, value, case_sensitive)
+
+    def _compile(self, operation, value, case_sensitive):
+        flags = 0 if case_sensitive else re.IGNORECASE
+
+        if operation == '~':
+            try:
+                return re.compile(value, flags).search
+            except re.error as e:
+                raise SearchQueryException('invalid regular expression "{}": {}'.format(value, e))
+
+        if self.numeric:
+            for symbol, compare in COMPARISONS:
+                if value.startswith(symbol):
+                    value = value[len(symbol):]
+                    break
+            else:
+                compare = operator.eq
+            try:
+                number = float(value)
+            except ValueError:
+                raise SearchQueryException('"{}" is not a number'.format(value))
+            # missing values are stored as -1 and never match
+            return lambda v: v != -1 and compare(v, number)
+
+        if '*' in value or '?' in value:
+            return re.compile(fnmatch.translate(value), flags).match
+        if case_sensitive:
+            return lambda v: value in v
+        value = value.casefold()
+        return lambda v: value in v.casefold()
+
+    def cost(self, entry_store):
+        """Rough relative cost of checking an entry, cheap terms are applied first."""
+        if self.numeric:
+            return 0
+        if DECODED_CONTENT in self.fields:
+            return 3
+        if all(isinstance(entry_store.columns.get(field), StringColumn) for field in self.fields):
+            return 1
+        return 2
+
+    def checker(self, entry_store):
+        """A function of an entry ID which tells whether the entry matches the term."""
+        field_checks = [self._fieldCheck(entry_store, field) for field in self.fields]
+        if self.negate:
+            return lambda k: not any(check(k) for check in field_checks)
+        return lambda k: any(check(k) for check in field_checks)
+
+    def _fieldCheck(self, entry_store, field):
+        match = self.match
+        if field == DECODED_CONTENT:
+            return lambda k: match(_decodedText(entry_store, k))
+
+        column = entry_store.columns.get(field)
+        if column is None:
+            # not extracted on import, building the whole column here would parse every
+            # entry before the first is checked
+            value = lambda k: entry_store.value(k, field, memoise=False)
+        else:
+            value = column.__getitem__
+
+        # each distinct value is only tested once
+        if isinstance(column, StringColumn):
+            matched = {}
+            def check(k):
+                code = column.codes[k]
+                if code not in matched:
+                    matched[code] = bool(match(str(column.values[code])))
+                return matched[code]
+            return check
+
+        if self.numeric:
+            return lambda k: match(value(k))
+
+        if field in OBJECT_FIELDS:
+            return lambda k: any(match(_objectText(item)) for item in value(k))
+
+        def check(k):
+            v = value(k)
+            return v and match(str(v))
+        return check
+
+
+class SearchQuery(object):
+    """A compiled global search query. Field terms are checked against the columns of
+    the entry store; any other terms are left for a plain search to check."""
+
+    def __init__(self, field_terms, text_terms):
+        self.field_terms = field_terms
+        self.text_terms = text_terms
+
+    def checker(self, entry_store):
+        """A function of an entry ID which tells whether the entry matches all of the
+        field terms."""
+        checks = [term.checker(entry_store)
+                  for term in sorted(self.field_terms, key=lambda term: term.cost(entry_store))]
+        return lambda k: all(check(k) for check in checks)
+
+
+def compileQuery(query, case_sensitive):
+    """Compile a search query. Returns None if the query doesn't scope any terms to a
+    field, in which case the whole query is searched for as is."""
+    # backslashes are left alone for the sake of regular expressions
+    lexer = shlex.shlex(query, posix=True)
+    lexer.whitespace_split = True
+    lexer.escape = ''
+    lexer.commenters = ''
+    try:
+        terms = list(lexer)
+    except ValueError:
+        # e.g. an unbalanced quote, treat the whole lot as a plain search
+        return None
+
+    field_terms = []
+    text_terms = []
+    for term in terms:
+        match = TERM.match(term)
+        fields = match and match.group(4) and _fields(match.group(2))
+        if fields:
+            negate, name, operation, value = match.groups()
+            field_terms.append(FieldTerm(fields, operation, value, bool(negate), case_sensitive))
+        else:
+            text_terms.append(term)
+
+    if not field_terms:
+        return None
+    return SearchQuery(field_terms, text_terms)